@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Modules import each other as top-level packages (as under `streamlit run SumGPT/main.py`)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cli import main  # noqa: E402
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,125 @@
-import asyncio
 import datetime
+import hashlib
 import json
-from typing import Any, Dict, List, Optional, Tuple
+import os
+import queue
+import tempfile
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
 
 import streamlit as st
-import utils.io as io
+from core.chunker import Chunker
+from core.compressor import Compressor
 from core.crypto import Crypto
-from core.llm import LLM
+from core.ingest import TEXT_EXTENSIONS, Ingestor, decode_text, extension
+from core.jobs import CANCELLED, FAILED, JobRunner
+from core.pipeline import (
+    ALL_FILES,
+    Pipeline,
+    chunks_from_spans,
+    segment_files,
+    serialize_markdown,
+    sort_chunks,
+    system_prompt,
+)
+from core.planner import Planner
+from core.telemetry import PERCENTILES, Telemetry
 from core.tokenizer import Tokenizer
 from datamodel.chunk import Chunk
 from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+from datamodel.summary import Summary
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from streamlit_cookies_controller import CookieController
 
+STREAM_RENDER_INTERVAL = 0.1  # seconds between redraws of a streaming summary
+PREVIEW_PAGE_SIZE = 10  # chunks per page of the chunk preview
+PREVIEW_CHARS = 1000  # characters shown per chunk in the preview
+RESULTS_PAGE_SIZE = 20  # summaries per page of the results view
+JOB_POLL_INTERVAL = 2  # seconds between status polls of a background job
+JOB_RECENT_RESULTS = 3  # latest summaries shown while a background job runs
+SERVER_MAX_CONCURRENCY = 16  # requests in flight across all runs and background jobs
+CALLBACK_POLL_INTERVAL = 0.05  # seconds between checks for callbacks of a foreground run
+
+T = TypeVar("T")
+
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def _split_text(
+    text_hash: str, _text: str, chunk_size: int, model: str, mode: str, overlap: int
+) -> Tuple[Tuple[Tuple[int, int, int], ...], int]:
+    # Memoized across reruns and sessions; keyed on the text hash so the text itself is
+    # never hashed by streamlit. Only spans are kept, so the cache holds no chunk text.
+    spans, total_tokens = Chunker(model, chunk_size, mode, overlap).split(_text)
+    return tuple(spans), total_tokens
+
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def _compress_chunks(
+    text_hash: str,
+    _chunks: List[Chunk],
+    chunk_size: int,
+    model: str,
+    mode: str,
+    overlap: int,
+    ratio: float,
+) -> Tuple[Tuple[str, int], ...]:
+    # Keyed like `_split_text` plus the ratio; holds the compressed text, which is
+    # smaller than the file it came from
+    compressed = Compressor(model, ratio).compress(_chunks)
+    return tuple((chunk.content, chunk.tokens) for chunk in compressed)
+
+
+@st.cache_resource(max_entries=64, show_spinner="Extracting text...")
+def _extract_documents(file_hashes: Tuple[str, ...], _files) -> Tuple[str, ...]:
+    # PDF and docx parsers read from disk, so the uploads are spilled to a temporary
+    # directory and parsed in parallel. Memoized by content hash across reruns.
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index, file in enumerate(_files):
+            path = os.path.join(directory, f"{index}{extension(file.name)}")
+            with open(path, "wb") as f:
+                f.write(file.getbuffer())
+            paths.append(path)
+        return tuple(Ingestor().ingest(paths))
+
+
+@st.cache_resource(show_spinner=False)
+def _job_runner() -> JobRunner:
+    # One runner per server process, shared by every session
+    return JobRunner(int(st.secrets.get("max_concurrency", SERVER_MAX_CONCURRENCY)))
+
+
+class _ScriptThreadCalls:
+    def __init__(self):
+        """Callbacks of a run on the job runner's loop, queued and replayed on the script
+        thread, which is the only one allowed to draw the page."""
+        self._calls: queue.Queue = queue.Queue()
+
+    def wrap(self, callback: Callable[..., None]) -> Callable[..., None]:
+        return lambda *args: self._calls.put((callback, args))
+
+    def wait(self, future: "Future[T]") -> T:
+        """Replay callbacks until `future` is done, then return its result. The run is
+        cancelled if the script is stopped first."""
+        try:
+            while not future.done():
+                try:
+                    callback, args = self._calls.get(timeout=CALLBACK_POLL_INTERVAL)
+                except queue.Empty:
+                    continue
+                callback(*args)
+            # Callbacks queued just before the run finished
+            while not self._calls.empty():
+                callback, args = self._calls.get_nowait()
+                callback(*args)
+        except BaseException:
+            future.cancel()
+            raise
+        return future.result()
+
 
 class BodyHandler:
     def file_uploader(self, type: List[str] = ["txt"]) -> List[Dict[str, str]]:
@@ -22,44 +130,126 @@ class BodyHandler:
         if uploaded_files is None:
             st.stop()
             st.warning("File is not uploaded.")
+        documents = []
         for file in uploaded_files:
-            text = io.read_to_string(file)
-            filename = file.name
-            files.append({"filename": filename, "text": text})
+            text_hash = hashlib.sha256(file.getbuffer()).hexdigest()
+            text = None
+            if extension(file.name) in TEXT_EXTENSIONS:
+                file.seek(0)
+                text = decode_text(file)
+            else:
+                documents.append(len(files))
+            files.append({"filename": file.name, "text": text, "hash": text_hash})
+
+        if documents:
+            texts = _extract_documents(
+                tuple(files[i]["hash"] for i in documents),
+                [uploaded_files[i] for i in documents],
+            )
+            for index, text in zip(documents, texts):
+                files[index]["text"] = text
         return files
 
-    def segment_text(
-        self, text: str, chunk_size: int, model: str, input_id: int
-    ) -> Tuple[List[Chunk], int]:
-        chunks: List[Chunk] = []
-        tokenizer = Tokenizer(model)
-        total_tokens = tokenizer.tokenize(text)
-        count = 0
-        for i in range(0, len(total_tokens), chunk_size):
-            chunk_tokens = total_tokens[i : i + chunk_size]
-            content = tokenizer.detokenize(chunk_tokens)
-            chunks.append(Chunk(count, content, len(chunk_tokens), input_id))
-            count += 1
-        return chunks, len(total_tokens)
-
-    def _get_tokens(self, response_meta: Dict[str, Any]) -> Tuple[int, int, int]:
-        completion_tokens = response_meta.get("token_usage", {}).get("completion_tokens", 0)
-        prompt_tokens = response_meta.get("token_usage", {}).get("prompt_tokens", 0)
-        cached_tokens = (
-            response_meta.get("token_usage", {})
-            .get("prompt_tokens_details", {})
-            .get("cached_tokens", 0)
+    def segment_files(
+        self,
+        files: List[Dict[str, str]],
+        chunk_size: int,
+        model: str,
+        mode: str = "tokens",
+        overlap: int = 0,
+        compress_ratio: float = 1.0,
+    ) -> List[Tuple[List[Chunk], int, float]]:
+        """`segment_files` over the uploaded files with the shared segmentation cache,
+        compressing their chunks when `compress_ratio` is below 1. `total_tokens` is
+        counted before compression."""
+
+        def segment(
+            text: str, chunk_size: int, model: str, input_id: int, mode: str, overlap: int
+        ) -> Tuple[List[Chunk], int]:
+            text_hash = files[input_id]["hash"]
+            spans, total_tokens = _split_text(text_hash, text, chunk_size, model, mode, overlap)
+            chunks = chunks_from_spans(text, spans, input_id)
+            if compress_ratio < 1:
+                compressed = _compress_chunks(
+                    text_hash, chunks, chunk_size, model, mode, overlap, compress_ratio
+                )
+                chunks = [
+                    Chunk(chunk.id, content, tokens, input_id)
+                    for chunk, (content, tokens) in zip(chunks, compressed)
+                ]
+            return chunks, total_tokens
+
+        # Worker threads need the script context to use the shared segmentation cache
+        initializer = partial(add_script_run_ctx, None, get_script_run_ctx())
+        texts = [file["text"] for file in files]
+        return segment_files(
+            texts, chunk_size, model, mode, overlap, segment=segment, initializer=initializer
         )
-        return completion_tokens, prompt_tokens, cached_tokens
+
+    def preview_chunks(self, chunks: List[Chunk], key: str) -> None:
+        """Render one page of chunk previews, only once the preview is switched on, so a
+        rerun sends just the visible chunks to the browser."""
+        if not chunks or not st.toggle("Preview chunks", key=f"preview_{key}"):
+            return
+        pages = (len(chunks) - 1) // PREVIEW_PAGE_SIZE + 1
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Page (of {pages})", 1, pages, 1, key=f"preview_page_{key}")
+        start = (page - 1) * PREVIEW_PAGE_SIZE
+        for chunk in chunks[start : start + PREVIEW_PAGE_SIZE]:
+            preview = chunk.preview(PREVIEW_CHARS)
+            if len(preview) == PREVIEW_CHARS:
+                preview += "…"
+            st.caption(f"Chunk {chunk.id}, tokens: `{chunk.tokens}`")
+            st.text(preview)
+
+    def _render_summary(
+        self, placeholder, content: str, tokens: int, price: float, note: str = ""
+    ) -> None:
+        with placeholder.container():
+            with st.chat_message("ai"):
+                st.write(content)
+                st.write(f"Tokens: `{tokens}`, price: `${price}`{note}")
+
+    def _render_reduced(self, placeholder, content: str) -> None:
+        with placeholder.container():
+            with st.chat_message("ai"):
+                st.markdown("**Combined summary**")
+                st.write(content)
+
+    def _render_plan(
+        self, chunks: List[Chunk], gpt_params: LLMParams, run_params: RunParams, role: str
+    ) -> None:
+        system = system_prompt(role, run_params.shared_context)
+        role_tokens = len(Tokenizer(gpt_params.model.name).tokenize(system))
+        plan = Planner(gpt_params, run_params, role_tokens).plan(chunks)
+        st.caption(
+            f"Estimate: `{plan.requests}` requests, "
+            f"expected `${round(plan.expected_cost, 4)}` (worst `${round(plan.worst_cost, 4)}`), "
+            f"about `{datetime.timedelta(seconds=round(plan.expected_seconds))}` "
+            "before cache hits."
+        )
+        if run_params.max_price and plan.worst_cost > run_params.max_price:
+            st.warning(
+                f"⚠️ The worst case exceeds the `${run_params.max_price}` budget; "
+                "the run stops sending requests once it is reached."
+            )
+        if run_params.max_tokens and plan.worst_tokens > run_params.max_tokens:
+            st.warning(
+                f"⚠️ The worst case exceeds the `{run_params.max_tokens}` token budget; "
+                "the run stops sending requests once it is reached."
+            )
 
     def agenerate(
         self,
         chunks: List[Chunk],
         gpt_params: LLMParams,
+        run_params: RunParams,
         role: str,
         api_key: Optional[str],
         config: Dict[str, Any],
     ) -> None:
+        self._render_plan(chunks, gpt_params, run_params, role)
         generate_button = st.button(
             "🚀 Run",
         )
@@ -67,6 +257,7 @@ class BodyHandler:
         progress_text = st.empty()
 
         total_price_text = st.empty()
+        cache_text = st.empty()
 
         if generate_button:
             if not api_key:
@@ -77,16 +268,24 @@ class BodyHandler:
                 return
 
             st.session_state["summaries"] = []  # Initialize or reset summaries
+            st.session_state["reduced"] = []
+            st.session_state["totals"] = {}
+            st.session_state.pop("job_message", None)
+            st.session_state.pop("telemetry", None)
 
-            async def process_chunks():
-                llm = LLM(api_key, gpt_params)
-                total_price = 0
+            def process_chunks():
+                # The run goes on the job runner's loop, whose pooled connections outlive it,
+                # and shares the server's concurrency and rate limits with every other run
+                runner = _job_runner()
+                calls = _ScriptThreadCalls()
+                scheduler = runner.scheduler(gpt_params.model)
+                pipeline = Pipeline(api_key, gpt_params, run_params, role, scheduler)
+                st.session_state["telemetry"] = pipeline.telemetry
                 progress_bar = st.progress(0)
                 completed_chunks = 0
                 progress_text.write(f"Generating summaries 0/{total_chunks}")
 
-                # Sort chunks by chunk.id
-                sorted_chunks = sorted(chunks, key=lambda c: c.id)
+                sorted_chunks = sort_chunks(chunks)
 
                 # Group chunks by filename
                 filename_chunks = {}
@@ -95,53 +294,177 @@ class BodyHandler:
                         filename_chunks[chunk.filename] = []
                     filename_chunks[chunk.filename].append(chunk)
 
-                # Create expanders for each file
-                expanders = {
-                    filename: st.expander(f"{filename}") for filename in filename_chunks.keys()
-                }
+                # Create expanders for each file, with one placeholder per chunk so results
+                # land in document order regardless of completion order
+                placeholders = []
+                reduce_placeholders = {}
+                map_reduce = run_params.summary_mode == "map-reduce"
+                for filename, file_chunks in filename_chunks.items():
+                    with st.expander(f"{filename}"):
+                        if map_reduce:
+                            reduce_placeholders[filename] = st.empty()
+                        placeholders.extend(st.empty() for _ in file_chunks)
 
-                # Create tasks for all chunks (sorted by chunk.id)
-                tasks = [llm.agenerate(chunk.content, role) for chunk in sorted_chunks]
+                last_render: Dict[int, float] = {}
 
-                # Run all tasks and get the results in the same order
-                summaries = await asyncio.gather(*tasks)
+                def on_partial(index: int, text: str) -> None:
+                    now = time.monotonic()
+                    if now - last_render.get(index, 0.0) >= STREAM_RENDER_INTERVAL:
+                        with placeholders[index].container():
+                            with st.chat_message("ai"):
+                                st.write(text + "▌")
+                        last_render[index] = now
 
-                # Process the results in order
-                for summary, current_chunk in zip(summaries, sorted_chunks):
+                def on_summary(index: int, summary: Summary) -> None:
+                    nonlocal completed_chunks
                     completed_chunks += 1
                     progress_text.write(f"Generating summaries {completed_chunks}/{total_chunks}")
                     progress_bar.progress(completed_chunks / total_chunks)
+                    if summary.error:
+                        with placeholders[index].container():
+                            st.error(f"❌ {summary.error}")
+                    elif summary.from_cache:
+                        note = f" (cached, saved `${summary.saved_price}`)"
+                        self._render_summary(
+                            placeholders[index], summary.content, summary.tokens, 0, note
+                        )
+                        cache_text.write(
+                            f"Cache hits: `{pipeline.cache_hits}/{total_chunks}`, "
+                            f"saved: `${round(pipeline.saved_price, 6)}`"
+                        )
+                    elif summary.duplicate_of is not None:
+                        source = summary.duplicate_of
+                        note = f" (same as `{source.filename}` chunk {source.id + 1})"
+                        self._render_summary(
+                            placeholders[index], summary.content, summary.tokens, 0, note
+                        )
+                    else:
+                        note = ""
+                        if summary.resumed:
+                            note = f" (resumed, paid `${summary.saved_price}` earlier)"
+                        self._render_summary(
+                            placeholders[index],
+                            summary.content,
+                            summary.tokens,
+                            summary.price,
+                            note,
+                        )
+                        total_price_text.write(
+                            f"Total price: `${round(pipeline.total_price, 6)}`"
+                        )
+
+                summaries = calls.wait(
+                    runner.run(
+                        pipeline.summarize(
+                            sorted_chunks, calls.wrap(on_summary), calls.wrap(on_partial)
+                        )
+                    )
+                )
+
+                # Store the summaries in session state, in document order, with totals
+                # computed once here rather than on every rerun
+                st.session_state["summaries"] = [
+                    summary.to_dict() for summary in summaries if not summary.error
+                ]
+                st.session_state["totals"] = {
+                    "count": len(st.session_state["summaries"]),
+                    "tokens": sum(s["tokens"] for s in st.session_state["summaries"]),
+                    "filenames": list(filename_chunks),
+                }
+
+                if map_reduce:
+                    progress_text.write("Merging summaries...")
+                    all_files_placeholder = None
+                    if run_params.cross_file and len(filename_chunks) > 1:
+                        with st.expander(ALL_FILES, expanded=True):
+                            all_files_placeholder = st.empty()
+
+                    def on_reduced(filename: str, content: str) -> None:
+                        if filename == ALL_FILES:
+                            self._render_reduced(all_files_placeholder, content)
+                        else:
+                            self._render_reduced(reduce_placeholders[filename], content)
 
-                    with expanders[current_chunk.filename]:
-                        with st.chat_message("ai"):
-                            st.write(summary.content)
-                            completion_tokens, prompt_tokens, cached_tokens = self._get_tokens(
-                                summary.response_metadata
-                            )
-                            price = round(
-                                llm.Calc_price(prompt_tokens, completion_tokens, cached_tokens), 6
-                            )
-                            st.write(
-                                f"Tokens: `{completion_tokens + prompt_tokens}`, price: `${price}`"
-                            )
-                            total_price += price
-
-                    # Store the summary in session state
-                    st.session_state["summaries"].append(
-                        {
-                            "filename": current_chunk.filename,
-                            "content": summary.content,
-                            "tokens": completion_tokens + prompt_tokens,
-                            "price": price,
-                        }
+                    reduced = calls.wait(
+                        runner.run(pipeline.reduce(summaries, calls.wrap(on_reduced)))
                     )
+                    st.session_state["reduced"] = [
+                        {"filename": filename, "content": content}
+                        for filename, content in reduced.items()
+                    ]
+                    for stats in sorted(pipeline.reducer.levels.values(), key=lambda s: s.level):
+                        st.caption(
+                            f"Merge level {stats.level}: `{stats.requests}` requests, "
+                            f"tokens: `{stats.tokens}`, price: `${round(stats.price, 6)}`"
+                        )
+                    for filename, error in pipeline.reduce_errors.items():
+                        st.error(f"❌ Failed to merge `{filename}`: {error}")
 
-                progress_text.write("✅ All chunks processed!")
+                if pipeline.budget.exceeded:
+                    progress_text.write(
+                        f"⚠️ Budget reached, {pipeline.failed}/{total_chunks} chunks were not "
+                        "summarized. Raise the budget and press Run again to finish them."
+                    )
+                elif pipeline.failed:
+                    progress_text.write(
+                        f"⚠️ {pipeline.failed}/{total_chunks} chunks failed. "
+                        "Press Run again to retry only the failed chunks."
+                    )
+                else:
+                    progress_text.write("✅ All chunks processed!")
                 progress_bar.progress(1.0)
-                total_price_text.write(f"Total price: `${round(total_price, 6)}`")
+                st.session_state["totals"]["price"] = pipeline.total_price
+                total_price_text.write(f"Total price: `${round(pipeline.total_price, 6)}`")
+                if pipeline.prompt_tokens:
+                    cached_ratio = pipeline.cached_tokens / pipeline.prompt_tokens
+                    st.caption(
+                        f"Prompt tokens: `{pipeline.prompt_tokens}`, "
+                        f"cached: `{pipeline.cached_tokens}` ({cached_ratio:.0%}), "
+                        f"uncached: `{pipeline.prompt_tokens - pipeline.cached_tokens}`."
+                    )
+                if pipeline.warmed:
+                    st.caption(f"Warmed the prompt cache with `{pipeline.warmed}` requests.")
+                if pipeline.duplicates:
+                    st.caption(
+                        f"Skipped `{pipeline.duplicates}` duplicate chunks, avoiding "
+                        f"`{pipeline.dedupe_saved_tokens}` tokens "
+                        f"(`${round(pipeline.dedupe_saved_price, 6)}`)."
+                    )
+                if pipeline.packed_requests:
+                    unpacked = ""
+                    if pipeline.unpacked:
+                        unpacked = f", `{pipeline.unpacked}` sent on their own"
+                    st.caption(
+                        f"Packed `{pipeline.packed_documents}` small files into "
+                        f"`{pipeline.packed_requests}` requests{unpacked}."
+                    )
+                if pipeline.resumed:
+                    st.caption(
+                        f"Resumed `{pipeline.resumed}` chunks from an earlier attempt, which "
+                        f"paid `${round(pipeline.resumed_price, 6)}` for them."
+                    )
+                if pipeline.hedging and pipeline.hedging.hedges:
+                    st.caption(
+                        f"Hedged `{pipeline.hedging.hedges}` slow requests, "
+                        f"`{pipeline.hedging.wins}` of them answered first by the duplicate; "
+                        f"the attempts that lost cost `${round(pipeline.budget.hedge_price, 6)}`."
+                    )
+                # The scheduler's own counts include the other runs sharing it
+                stats = pipeline.telemetry.stats()
+                if stats["timeouts"]:
+                    st.caption(f"`{stats['timeouts']}` requests timed out.")
+                if stats["retries"]:
+                    st.caption(f"Retried `{stats['retries']}` rate-limited or failed requests.")
 
-            # Run the async processing
-            asyncio.run(process_chunks())
+            if run_params.background:
+                # Hand the run to the server's job runner; the page stays interactive and
+                # polls for progress
+                st.session_state["job_id"] = _job_runner().submit(
+                    sort_chunks(chunks), gpt_params, run_params, role, api_key
+                )
+                self.job_view()
+            else:
+                process_chunks()
             crypto: Crypto = st.session_state["crypto"]
             config_binary = crypto.encrypt_b64(json.dumps(config))
             controler = CookieController()
@@ -151,28 +474,190 @@ class BodyHandler:
                 expires=datetime.datetime.now() + datetime.timedelta(days=30),
             )
         else:
+            if "job_message" in st.session_state:
+                progress_text.write(st.session_state["job_message"])
             # Check if summaries exist in session state and display them
-            if "summaries" in st.session_state:
-                total_price = 0
-                # Group summaries by filename
-                filename_summaries = {}
-                for summary_data in st.session_state["summaries"]:
-                    filename = summary_data["filename"]
-                    if filename not in filename_summaries:
-                        filename_summaries[filename] = []
-                    filename_summaries[filename].append(summary_data)
-
-                # Display summaries grouped by filename
-                for filename, summaries in filename_summaries.items():
-                    with st.expander(f"{filename}"):
-                        for summary_data in summaries:
-                            with st.chat_message("ai"):
-                                st.write(summary_data["content"])
-                                st.write(
-                                    f"Tokens: `{summary_data['tokens']}`, price: `${summary_data['price']}`"
-                                )
-                                total_price += summary_data["price"]
-                total_price_text.write(f"Total price: `${round(total_price, 6)}`")
+            if "job_id" in st.session_state:
+                self.job_view()
+            elif "summaries" in st.session_state:
+                totals = st.session_state.get("totals", {})
+                total_price_text.write(f"Total price: `${round(totals.get('price', 0), 6)}`")
+                self.results_view()
+
+    @st.fragment(run_every=JOB_POLL_INTERVAL)
+    def job_view(self) -> None:
+        """Poll the background job of this session. Once it finishes, its results are moved
+        into the session state and the page is redrawn with the regular results view."""
+        runner = _job_runner()
+        job = runner.store.get(st.session_state["job_id"])
+        if job is None:
+            del st.session_state["job_id"]
+            return
+
+        st.progress(
+            job.completed / job.total if job.total else 1.0,
+            text=f"Job `{job.id}` {job.status}: {job.completed}/{job.total} chunks, "
+            f"price: `${round(job.price, 6)}`",
+        )
+        if not job.done:
+            if st.button("⏹️ Cancel job"):
+                runner.cancel(job.id)
+            recent = runner.store.summaries(job.id, max(0, job.completed - JOB_RECENT_RESULTS))
+            for result in reversed(recent):
+                if not result["error"]:
+                    self._render_summary(
+                        st.empty(), result["content"], result["tokens"], result["price"]
+                    )
+            return
+
+        results = sorted(runner.store.summaries(job.id), key=lambda r: r["index"])
+        summaries = [
+            {key: r[key] for key in ("filename", "content", "tokens", "price")}
+            for r in results
+            if not r["error"]
+        ]
+        st.session_state["summaries"] = summaries
+        st.session_state["reduced"] = runner.store.combined(job.id)
+        st.session_state["totals"] = {
+            "count": len(summaries),
+            "tokens": sum(s["tokens"] for s in summaries),
+            "filenames": list(dict.fromkeys(s["filename"] for s in summaries)),
+            "price": job.price,
+        }
+        if job.status == FAILED:
+            st.session_state["job_message"] = f"❌ Job failed: {job.error}"
+        elif job.status == CANCELLED:
+            st.session_state["job_message"] = (
+                f"⏹️ Job cancelled after {job.completed}/{job.total} chunks."
+            )
+        elif job.error:
+            st.session_state["job_message"] = f"⚠️ Job {job.status}. {job.error}"
+        elif job.failed:
+            st.session_state["job_message"] = (
+                f"⚠️ Job {job.status}, {job.failed}/{job.total} chunks failed. "
+                "Press Run again to retry only the failed chunks."
+            )
+        else:
+            st.session_state["job_message"] = f"✅ Job {job.status}."
+        del st.session_state["job_id"]
+        st.rerun()
+
+    @st.fragment
+    def results_view(self) -> None:
+        """Browse the stored summaries one page at a time, filtered by file and text.
+        Runs as a fragment, so its widgets only redraw this part of the page."""
+        summaries: List[Dict[str, Any]] = st.session_state["summaries"]
+        reduced = {r["filename"]: r["content"] for r in st.session_state.get("reduced", [])}
+        totals = st.session_state.get("totals", {})
+        filenames = totals.get("filenames", [])
+        if not summaries and not reduced:
+            return
+
+        cols = st.columns([1, 1])
+        with cols[0]:
+            options = [ALL_FILES] + filenames
+            selected = st.selectbox("Filter by file", options, key="results_file")
+        with cols[1]:
+            query = st.text_input("Search summaries", key="results_query").strip().lower()
+
+        if selected in reduced:
+            with st.expander(f"{selected} (combined)", expanded=selected == ALL_FILES):
+                self._render_reduced(st.empty(), reduced[selected])
+
+        matches = [
+            summary
+            for summary in summaries
+            if (selected == ALL_FILES or summary["filename"] == selected)
+            and (not query or query in summary["content"].lower())
+        ]
+        if not matches:
+            st.caption("No summaries match.")
+            return
+
+        pages = (len(matches) - 1) // RESULTS_PAGE_SIZE + 1
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Page (of {pages})", 1, pages, 1, key="results_page")
+        start = (page - 1) * RESULTS_PAGE_SIZE
+        end = min(start + RESULTS_PAGE_SIZE, len(matches))
+        st.caption(
+            f"Showing `{start + 1}`-`{end}` of `{len(matches)}` summaries "
+            f"(`{totals.get('count', len(summaries))}` in total, "
+            f"tokens: `{totals.get('tokens', 0)}`)"
+        )
+        for summary_data in matches[start:end]:
+            with st.chat_message("ai"):
+                if selected == ALL_FILES:
+                    st.caption(summary_data["filename"])
+                st.write(summary_data["content"])
+                st.write(
+                    f"Tokens: `{summary_data['tokens']}`, price: `${summary_data['price']}`"
+                )
+
+    def telemetry_view(self) -> None:
+        """Dashboard of the request timings, throughput and usage of the last run, with
+        downloads of the per-request records and the Prometheus metrics."""
+        telemetry: Optional[Telemetry] = st.session_state.get("telemetry")
+        if telemetry is None:
+            return
+        stats = telemetry.stats()
+        if not stats["requests"]:
+            return
+
+        def seconds(value: Optional[float]) -> str:
+            return "-" if value is None else f"{value:.2f}s"
+
+        with st.expander("📈 Run telemetry"):
+            cols = st.columns(4)
+            cols[0].metric(
+                "Requests", stats["requests"], f"{stats['failed']} failed", delta_color="off"
+            )
+            cols[1].metric("Tokens/s", f"{stats['tokens_per_second']:.0f}")
+            cols[2].metric("Output tokens/s", f"{stats['output_tokens_per_second']:.0f}")
+            cols[3].metric("Retries", stats["retries"])
+
+            st.table(
+                {
+                    f"p{p}": {
+                        "Latency": seconds(stats["latency"][p]),
+                        "Time to first token": seconds(stats["ttft"][p]),
+                        "Waiting for a slot": seconds(stats["queue_wait"][p]),
+                        "Waiting for rate limits": seconds(stats["rate_wait"][p]),
+                    }
+                    for p in PERCENTILES
+                }
+            )
+            time_spent = stats["time"]
+            total = sum(time_spent.values()) or 1
+            st.caption(
+                "Share of request time spent waiting for a concurrency slot: "
+                f"`{time_spent['queue_wait'] / total:.0%}`, for rate limits: "
+                f"`{time_spent['rate_wait'] / total:.0%}`, backing off before retries: "
+                f"`{time_spent['backoff'] / total:.0%}`, in the model: "
+                f"`{time_spent['latency'] / total:.0%}`."
+            )
+            st.caption(
+                f"Tokens: prompt `{stats['prompt_tokens']}`, cached `{stats['cached_tokens']}`, "
+                f"completion `{stats['completion_tokens']}`; price `${round(stats['price'], 6)}` "
+                f"over `{stats['seconds']:.1f}s`, of which `${round(stats['abandoned_price'], 6)}` "
+                f"on requests cancelled in flight (`${round(stats['hedge_price'], 6)}` on hedges)."
+            )
+
+            cols = st.columns(2)
+            with cols[0]:
+                st.download_button(
+                    "📥 Requests (JSONL)",
+                    telemetry.to_jsonl(),
+                    "telemetry.jsonl",
+                    mime="application/jsonl",
+                )
+            with cols[1]:
+                st.download_button(
+                    "📥 Metrics (Prometheus)",
+                    telemetry.to_prometheus(),
+                    "sumgpt.prom",
+                    mime="text/plain",
+                )
 
     def download_summaries(self):
         if "summaries" in st.session_state:
@@ -181,24 +666,7 @@ class BodyHandler:
                 return
             st.download_button(
                 "📥 Download summaries",
-                self._serialize_summaries(summaries),
+                serialize_markdown(summaries, st.session_state.get("reduced", [])),
                 "summaries.md",
                 mime="application/markdown",
             )
-
-    def _serialize_summaries(self, summaries):
-        markdown = ""
-
-        markdown_by_filename = {}
-        for summary in summaries:
-            filename = summary["filename"]
-            if filename not in markdown_by_filename:
-                markdown_by_filename[filename] = []
-            markdown_by_filename[filename].append(summary["content"])
-
-        for filename, content in markdown_by_filename.items():
-            markdown += f"# {filename}\n"
-            markdown += "\n\n".join(content)
-            markdown += "\n\n"
-
-        return markdown
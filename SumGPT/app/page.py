@@ -1,18 +1,30 @@
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 import streamlit as st
+from core.ingest import EXTENSIONS
+from core.manifest import ManifestStore, settings_hash
 from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
 
 from app.body_handler import BodyHandler
 from app.sidebar_handler import SidebarHandler
 
 
+@st.cache_resource(show_spinner=False)
+def _manifest_store() -> ManifestStore:
+    # One connection per server process, shared by every session
+    return ManifestStore()
+
+
 class Page:
     def __init__(self):
         self.chunk_size: Optional[int] = None
+        self.chunk_mode: str = "tokens"
+        self.chunk_overlap: int = 0
         self.role: Optional[str] = None
         self.api_key: Optional[str] = None
         self.llm_params: Optional[LLMParams] = None
+        self.run_params: RunParams = RunParams()
         self.config: Dict[str, str] = {}
 
     def draw_header(self, version):
@@ -23,7 +35,12 @@ class Page:
             "Please [report any bugs](https://github.com/sean1832/SumGPT/issues) to the GitHub repo."
         )
 
-    def draw_sidebar(self, manifest: Dict[str, str], models_data: List[Dict[str, str]]) -> None:
+    def draw_sidebar(
+        self,
+        manifest: Dict[str, str],
+        models_data: Dict[str, Any],
+        prompts: List[Dict[str, Any]],
+    ) -> None:
         with st.sidebar:
             sb = SidebarHandler()
             sb.header()
@@ -33,6 +50,9 @@ class Page:
                 self.role = sb.role_settings_panel()
             with st.expander("⚙️ Configuration"):
                 self.llm_params, self.chunk_size = sb.config_control_panel(models_data)
+                self.chunk_mode, self.chunk_overlap = sb.chunking_control_panel(self.chunk_size)
+            with st.expander("🚀 Run settings"):
+                self.run_params = sb.run_control_panel(prompts, self.chunk_size)
 
             cols = st.columns([1, 1])
             with cols[0]:
@@ -54,24 +74,53 @@ class Page:
             return
 
         body = BodyHandler()
-        texts = body.file_uploader(["txt", "md"])
+        texts = body.file_uploader([ext.lstrip(".") for ext in EXTENSIONS])
 
         total_chunks = []
-        filenames = []
+        filenames = [text["filename"] for text in texts]
+        segmented = body.segment_files(
+            texts,
+            self.chunk_size,
+            self.llm_params.model.name,
+            self.chunk_mode,
+            self.chunk_overlap,
+            self.run_params.compress_ratio,
+        )
 
-        for idx, text in enumerate(texts):
-            filename = text["filename"]
-            filenames.append(filename)
-            chunks, total_token_size = body.segment_text(
-                text["text"], self.chunk_size, self.llm_params.model.name, idx
+        # Unchanged chunks of a re-uploaded document are only reused through the cache
+        manifests = _manifest_store() if self.run_params.use_cache else None
+        settings = settings_hash(self.role, self.llm_params, self.run_params)
+        for filename, (chunks, total_token_size, seconds) in zip(filenames, segmented):
+            label = f"`{filename}` **(chunks: {len(chunks)})**"
+            changed = (
+                manifests.changed(self.run_params.manifest_owner, filename, chunks, settings)
+                if manifests is not None
+                else None
             )
-            with st.expander(f"`{filename}` **(chunks: {len(chunks)})**"):
+            if changed is not None:
+                label = f"`{filename}` **(chunks: {len(chunks)}, changed: {len(changed)})**"
+            with st.expander(label):
                 for chunk in chunks:
                     chunk.set_filename_from_list(filenames)
-                st.write([chunk.to_dict() for chunk in chunks])
-                st.write(f"Tokens: `{total_token_size}`")
+                st.write(f"Tokens: `{total_token_size}`, segmented in `{seconds:.2f}s`")
+                if self.run_params.compress_ratio < 1:
+                    compressed_tokens = sum(chunk.tokens for chunk in chunks)
+                    st.write(
+                        f"Compressed to `{compressed_tokens}` tokens "
+                        f"({compressed_tokens / max(1, total_token_size):.0%})"
+                    )
+                if changed is not None:
+                    st.write(
+                        f"Changed since the last summary: `{len(changed)}` of `{len(chunks)}` "
+                        "chunks, counting changes of the role, model, temperature, max tokens "
+                        "and context settings. The others are served from the summary cache."
+                    )
+                body.preview_chunks(chunks, filename)
 
                 total_chunks.extend(chunks)
 
-        body.agenerate(total_chunks, self.llm_params, self.role, self.api_key, self.config)
+        body.agenerate(
+            total_chunks, self.llm_params, self.run_params, self.role, self.api_key, self.config
+        )
         body.download_summaries()
+        body.telemetry_view()
@@ -1,12 +1,19 @@
 import json
+import uuid
 from typing import Any, Dict, List, Tuple
 
 import streamlit as st
 import utils.helpers as helpers
+from core.chunker import Chunker
 from core.crypto import Crypto
+from core.pipeline import DEFAULT_ROLE
+from datamodel.llm_model import LLMBackend
 from datamodel.llm_params import LLMModel, LLMParams
+from datamodel.run_params import RunParams
 from streamlit_cookies_controller import CookieController
 
+from app.body_handler import SERVER_MAX_CONCURRENCY
+
 
 class SidebarHandler:
     def __init__(self):
@@ -29,6 +36,14 @@ class SidebarHandler:
             except TypeError:
                 self.config = {}
                 self.cookie_controller.remove("config")  # Remove invalid cookie
+            self._take_shared_context()
+
+    def _take_shared_context(self, overwrite: bool = False):
+        # The shared context can be far larger than a cookie allows, so it only lives in the
+        # session and the exported config file
+        shared_context = self.config.pop("shared_context", None)
+        if shared_context is not None and (overwrite or not st.session_state.get("shared_context")):
+            st.session_state["shared_context"] = shared_context
 
     def header(self):
         st.markdown("### How to use:")
@@ -55,12 +70,7 @@ class SidebarHandler:
         )
         role = st.text_area(
             "Role settings",
-            self.config.get(
-                "role",
-                "Write a detailed summary in perfect $(LANGUAGE) that is concise, clear and coherent while capturing the main ideas the text. "
-                "The summary should be well-structured and free of grammatical errors.\n\n"
-                "The summary is to be written in markdown format, with a heading (###) that encapsulate the core concept of the content. It should be concise and specific. avoid generic headings like 'Summary' or 'Introduction'.",
-            ),
+            self.config.get("role", DEFAULT_ROLE),
             height=height,
         )
         if role is None:
@@ -73,13 +83,15 @@ class SidebarHandler:
         role = role.replace("$(LANGUAGE)", language)
         return role
 
-    def config_control_panel(self, models_data: List[Dict[str, str]]) -> Tuple[LLMParams, int]:
-        model_names = helpers.extract_values(models_data, "model")
+    def config_control_panel(self, models_data: Dict[str, Any]) -> Tuple[LLMParams, int]:
+        models = models_data["models"]
+        model_names = helpers.extract_values(models, "model")
         model_name = st.selectbox("Model", model_names, self.config.get("model_index", 0))
-        model = LLMModel.construct_from_dict(self._get_model_dict(models_data, model_name))
+        backends = LLMBackend.construct_registry(models_data.get("backends", []))
+        model = LLMModel.construct_from_dict(self._get_model_dict(models, model_name), backends)
         self.config["model"] = model_name
 
-        _param = self._construct_param(models_data, model_name)
+        _param = self._construct_param(models, model_name)
 
         chunk_size = st.number_input(
             "Chunk size (tokens)",
@@ -110,6 +122,233 @@ class SidebarHandler:
             chunk_size,
         )
 
+    def chunking_control_panel(self, chunk_size: int) -> Tuple[str, int]:
+        chunk_mode = st.selectbox(
+            "Chunking mode",
+            Chunker.MODES,
+            self._option_index(Chunker.MODES, "chunk_mode", "tokens"),
+            help="`tokens` cuts at fixed token offsets. The structural modes cut at markdown "
+            "headings, paragraphs or sentences and pack them up to the chunk size. `content` "
+            "picks sentence boundaries from the text itself, so editing a document only "
+            "changes the chunks around the edit.",
+        )
+        self.config["chunk_mode"] = chunk_mode
+
+        chunk_overlap: int = st.number_input(
+            "Chunk overlap (tokens)",
+            0,
+            chunk_size // 2,
+            min(self.config.get("chunk_overlap", 0), chunk_size // 2),
+            help="Repeat the end of each chunk at the start of the next for context.",
+        )
+        self.config["chunk_overlap"] = chunk_overlap
+
+        return chunk_mode, chunk_overlap
+
+    def run_control_panel(self, prompts: List[Dict[str, Any]], chunk_size: int) -> RunParams:
+        # Every run goes through the server's shared limiter, so the limit is the server's
+        max_concurrency = int(st.secrets.get("max_concurrency", SERVER_MAX_CONCURRENCY))
+
+        stream: bool = st.checkbox(
+            "Stream output",
+            self.config.get("stream", True),
+            help="Type out each summary as it is generated.",
+        )
+        self.config["stream"] = stream
+
+        use_cache: bool = st.checkbox(
+            "Use summary cache",
+            self.config.get("use_cache", True),
+            help="Reuse summaries of identical chunks generated with the same role and settings.",
+        )
+        self.config["use_cache"] = use_cache
+
+        resume: bool = st.checkbox(
+            "Resume interrupted runs",
+            self.config.get("resume", True),
+            help="Skip chunks an earlier run with the same files and settings already completed.",
+        )
+        self.config["resume"] = resume
+
+        summary_modes = ["chunks", "map-reduce"]
+        summary_mode = st.selectbox(
+            "Summary mode",
+            summary_modes,
+            self._option_index(summary_modes, "summary_mode", "chunks"),
+            help="`map-reduce` recursively merges the chunk summaries of each file into one.",
+        )
+        self.config["summary_mode"] = summary_mode
+
+        cross_file: bool = st.checkbox(
+            "Combine all files",
+            self.config.get("cross_file", False),
+            disabled=summary_mode != "map-reduce",
+            help="Also merge the per-file summaries into a single summary.",
+        )
+        self.config["cross_file"] = cross_file
+
+        max_price: float = st.number_input(
+            "Budget (USD)",
+            0.0,
+            value=float(self.config.get("max_price", 0.0)),
+            step=0.1,
+            help="Stop sending requests once this much could be spent. 0 means no limit.",
+        )
+        self.config["max_price"] = max_price
+
+        token_budget: int = st.number_input(
+            "Token budget",
+            0,
+            value=int(self.config.get("max_tokens_budget", 0)),
+            step=10000,
+            help="Stop sending requests once this many tokens could be used. 0 means no limit.",
+        )
+        self.config["max_tokens_budget"] = token_budget
+
+        shared_context: str = st.text_area(
+            "Shared context",
+            key="shared_context",
+            help="Few-shot examples or background sent unchanged with every request. "
+            "Placed before the chunk so all requests share one cacheable prompt prefix.",
+        )
+
+        file_context_tokens: int = st.number_input(
+            "File context tokens",
+            0,
+            8192,
+            self.config.get("file_context_tokens", 0),
+            step=256,
+            help="Include this many tokens from the beginning of each file with every chunk "
+            "of that file, as part of the shared prompt prefix.",
+        )
+        self.config["file_context_tokens"] = file_context_tokens
+
+        prefix_cache: bool = st.checkbox(
+            "Warm prompt cache",
+            self.config.get("prefix_cache", False),
+            help="Send one request per shared prefix first so the rest read it from the "
+            "provider's prompt cache. Only prefixes of 1024 tokens or more are cached.",
+        )
+        self.config["prefix_cache"] = prefix_cache
+
+        pack_small: bool = st.checkbox(
+            "Pack small files",
+            self.config.get("pack_small", False),
+            disabled=file_context_tokens > 0,
+            help="Summarize several files that each fit in one chunk with a single request, up "
+            "to the chunk size. Not available with file context.",
+        )
+        self.config["pack_small"] = pack_small
+
+        compress_ratio: float = st.slider(
+            "Keep share of input",
+            0.2,
+            1.0,
+            float(self.config.get("compress_ratio", 1.0)),
+            step=0.05,
+            help="Drop the least informative sentences of each chunk locally before sending "
+            "it, such as boilerplate, repeated lines and tables of numbers. 1 keeps everything.",
+        )
+        self.config["compress_ratio"] = compress_ratio
+
+        dedupe: bool = st.checkbox(
+            "Skip duplicate chunks",
+            self.config.get("dedupe", False),
+            help="Summarize only one of each group of identical or nearly identical chunks, "
+            "such as repeated footers or disclaimers, and reuse its summary for the rest.",
+        )
+        self.config["dedupe"] = dedupe
+
+        dedupe_threshold: float = st.slider(
+            "Duplicate similarity",
+            0.5,
+            1.0,
+            float(self.config.get("dedupe_threshold", 0.85)),
+            step=0.05,
+            disabled=not dedupe,
+            help="How similar two chunks must be to share a summary. 1 means identical only.",
+        )
+        self.config["dedupe_threshold"] = dedupe_threshold
+
+        request_timeout: int = st.number_input(
+            "Request timeout (s)",
+            0,
+            3600,
+            int(self.config.get("request_timeout", 0)),
+            step=30,
+            help="Abandon and retry a request that takes longer than this. 0 means no limit.",
+        )
+        self.config["request_timeout"] = request_timeout
+
+        hedge_options = [0, 90, 95, 99]
+        hedge_percentile: int = st.selectbox(
+            "Hedge slow requests",
+            hedge_options,
+            self._option_index(hedge_options, "hedge_percentile", 0),
+            format_func=lambda p: f"after p{p} latency" if p else "off",
+            help="Send a duplicate of any request slower than this share of recent requests "
+            "and keep whichever answers first, cutting the tail of long runs.",
+        )
+        self.config["hedge_percentile"] = hedge_percentile
+
+        hedge_budget: int = st.number_input(
+            "Hedge budget (%)",
+            0,
+            100,
+            int(self.config.get("hedge_budget", 10)),
+            disabled=not hedge_percentile,
+            help="Most that duplicate requests may add to the cost of a run.",
+        )
+        self.config["hedge_budget"] = hedge_budget
+
+        background: bool = st.checkbox(
+            "Run in background",
+            self.config.get("background", False),
+            help="Run on the server's shared job queue. The page stays usable during the "
+            "run, which keeps going if the page is closed.",
+        )
+        self.config["background"] = background
+
+        language = self.config.get("role_language", "English")
+        final_prompt = prompts[helpers.extract_dict_index(prompts, "type", "final")]["prompt"]
+        recursive_index = helpers.extract_dict_index(prompts, "type", "recursive")
+        recursive_prompt = prompts[recursive_index]["prompt"]
+
+        return RunParams(
+            max_concurrency=max_concurrency,
+            stream=stream,
+            use_cache=use_cache,
+            summary_mode=summary_mode,
+            cross_file=cross_file,
+            reduce_prompt=final_prompt.replace("[LANGUAGE]", language),
+            recursive_prompt=recursive_prompt.replace("[LANGUAGE]", language),
+            resume=resume,
+            max_price=max_price,
+            max_tokens=token_budget,
+            prefix_cache=prefix_cache,
+            shared_context=shared_context,
+            file_context_tokens=file_context_tokens,
+            background=background,
+            pack_tokens=chunk_size if pack_small and not file_context_tokens else 0,
+            request_timeout=request_timeout,
+            hedge_percentile=hedge_percentile,
+            hedge_budget=hedge_budget / 100,
+            dedupe_threshold=dedupe_threshold if dedupe else 0.0,
+            compress_ratio=compress_ratio,
+            manifest_owner=self._client_id(),
+        )
+
+    def _client_id(self) -> str:
+        # Kept in the config cookie, so a reload of the page still finds its manifests
+        if "client_id" not in self.config:
+            self.config["client_id"] = st.session_state.setdefault("client_id", uuid.uuid4().hex)
+        return self.config["client_id"]
+
+    def _option_index(self, options: List[Any], key: str, default: Any) -> int:
+        # Configs from older versions or edited by hand may hold an option that is gone
+        value = self.config.get(key, default)
+        return options.index(value if value in options else default)
+
     def _get_model_dict(self, models_data, selected_model) -> Dict[str, Any]:
         model_index = helpers.extract_dict_index(models_data, "model", selected_model)
         return models_data[model_index]
@@ -126,13 +365,24 @@ class SidebarHandler:
         config_file = st.file_uploader("📁 Import Config", type=["json"])
         if config_file:
             config = json.load(config_file)
+            # The client id belongs to this browser, not to the config file
+            config.pop("client_id", None)
+            if "client_id" in self.config:
+                config["client_id"] = self.config["client_id"]
             self.config = config
-            self.cookie_controller.set("config", self.crypto.encrypt_b64(json.dumps(config)))
+            self._take_shared_context(overwrite=True)
+            self.cookie_controller.set("config", self.crypto.encrypt_b64(json.dumps(self.config)))
 
     def export_config(self):
         st.download_button(
             "Export Config",
-            data=json.dumps(self.config, indent=2),
+            data=json.dumps(
+                {
+                    **{key: value for key, value in self.config.items() if key != "client_id"},
+                    "shared_context": st.session_state.get("shared_context", ""),
+                },
+                indent=2,
+            ),
             file_name="sumgpt_config.json",
         )
 
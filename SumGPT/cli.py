@@ -0,0 +1,309 @@
+import argparse
+import glob
+import os
+import sys
+from typing import List, Optional
+
+import utils.helpers as helpers
+import utils.io as io
+from core.batch import BatchJob
+from core.chunker import Chunker
+from core.compressor import Compressor
+from core.ingest import EXTENSIONS, Ingestor
+from core.llm import run_pooled
+from core.manifest import ManifestStore, settings_hash
+from core.planner import BudgetExceeded, Planner
+from core.pipeline import (
+    DEFAULT_ROLE,
+    Pipeline,
+    segment_files,
+    serialize_jsonl,
+    serialize_markdown,
+    sort_chunks,
+    system_prompt,
+)
+from core.tokenizer import Tokenizer
+from datamodel.llm_model import LLMBackend, LLMModel
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+from datamodel.summary import Summary
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def collect_files(inputs: List[str]) -> List[str]:
+    """Expand directories and glob patterns into a sorted, de-duplicated list of files."""
+    files: List[str] = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names if n.endswith(EXTENSIONS))
+        elif glob.has_magic(path):
+            files.extend(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+        else:
+            files.append(path)
+    return sorted(dict.fromkeys(files))
+
+
+def parse_args(argv: Optional[List[str]], models_data: List[dict]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m SumGPT", description="Summarize text files without the web UI."
+    )
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument(
+        "-m", "--model", default="gpt-4o-mini", choices=helpers.extract_values(models_data, "model")
+    )
+    parser.add_argument("-r", "--role", default=DEFAULT_ROLE, help="role (system prompt)")
+    parser.add_argument("--role-file", help="read the role from a file instead")
+    parser.add_argument("-l", "--language", default="English", help="replaces $(LANGUAGE)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="max requests in flight")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--chunk-mode", default="tokens", choices=Chunker.MODES)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--mode", default="chunks", choices=["chunks", "map-reduce"])
+    parser.add_argument("--cross-file", action="store_true", help="also merge all files")
+    parser.add_argument("--no-cache", action="store_true", help="disable the summary cache")
+    parser.add_argument(
+        "--no-resume", action="store_true", help="do not reuse chunks of an interrupted run"
+    )
+    parser.add_argument("-f", "--format", choices=["md", "jsonl"], help="default: from --output")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--base-url", help="OpenAI-compatible API base URL (overrides models.json)")
+    parser.add_argument("--context-file", help="few-shot examples or background for all chunks")
+    parser.add_argument(
+        "--file-context", type=int, default=0, help="leading tokens of each file to send along"
+    )
+    parser.add_argument(
+        "--warm-cache", action="store_true", help="warm the prompt cache before fanning out"
+    )
+    parser.add_argument(
+        "--compress",
+        type=float,
+        default=1.0,
+        metavar="RATIO",
+        help="locally drop low-information sentences, keeping this share of tokens (1 = off)",
+    )
+    parser.add_argument(
+        "--dedupe",
+        type=float,
+        nargs="?",
+        const=0.85,
+        default=0.0,
+        metavar="SIMILARITY",
+        help="summarize near-identical chunks once (default similarity: 0.85)",
+    )
+    parser.add_argument(
+        "--pack", action="store_true", help="summarize several small files per request"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=0.0, help="seconds per request attempt (0 = none)"
+    )
+    parser.add_argument(
+        "--hedge",
+        type=float,
+        default=0.0,
+        metavar="PERCENTILE",
+        help="duplicate requests slower than this latency percentile, e.g. 95 (0 = off)",
+    )
+    parser.add_argument(
+        "--hedge-budget", type=float, default=0.1, help="max extra cost of hedges (share)"
+    )
+    parser.add_argument("--telemetry", metavar="PATH", help="write per-request records (JSONL)")
+    parser.add_argument("--metrics", metavar="PATH", help="write Prometheus text-format metrics")
+    parser.add_argument("--budget", type=float, default=0.0, help="max spend in USD (0 = none)")
+    parser.add_argument("--token-budget", type=int, default=0, help="max tokens (0 = none)")
+    parser.add_argument("--plan", action="store_true", help="print the estimate and exit")
+    parser.add_argument("--batch", action="store_true", help="use the Batch API (half price)")
+    parser.add_argument("--batch-id", help="resume polling an earlier batch (implies --batch)")
+    parser.add_argument("--poll-interval", type=float, default=30.0, help="batch poll seconds")
+    args = parser.parse_args(argv)
+
+    if not args.api_key and not args.plan:
+        parser.error("an API key is required (--api-key or OPENAI_API_KEY)")
+    if args.format is None:
+        args.format = "jsonl" if args.output and args.output.endswith(".jsonl") else "md"
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    models_data = io.read_json_file(os.path.join(BASE_DIR, "models.json"))
+    prompts = io.read_json_file(os.path.join(BASE_DIR, "prompt.json"))
+    args = parse_args(argv, models_data["models"])
+
+    files = collect_files(args.inputs)
+    if not files:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    models = models_data["models"]
+    model_dict = models[helpers.extract_dict_index(models, "model", args.model)]
+    backends = LLMBackend.construct_registry(models_data.get("backends", []))
+    llm_params = LLMParams(
+        LLMModel.construct_from_dict(model_dict, backends), args.max_tokens, args.temperature
+    )
+    if args.base_url:
+        llm_params.model.backend.base_url = args.base_url
+    role = io.read_text_file(args.role_file) if args.role_file else args.role
+    role = role.replace("$(LANGUAGE)", args.language)
+    final_prompt = prompts[helpers.extract_dict_index(prompts, "type", "final")]["prompt"]
+    recursive_prompt = prompts[helpers.extract_dict_index(prompts, "type", "recursive")]["prompt"]
+    run_params = RunParams(
+        max_concurrency=args.concurrency,
+        stream=False,
+        use_cache=not args.no_cache,
+        summary_mode=args.mode,
+        cross_file=args.cross_file,
+        reduce_prompt=final_prompt.replace("[LANGUAGE]", args.language),
+        recursive_prompt=recursive_prompt.replace("[LANGUAGE]", args.language),
+        resume=not args.no_resume,
+        max_price=args.budget,
+        max_tokens=args.token_budget,
+        prefix_cache=args.warm_cache,
+        shared_context=io.read_text_file(args.context_file) if args.context_file else "",
+        file_context_tokens=args.file_context,
+        pack_tokens=args.chunk_size if args.pack and not args.file_context else 0,
+        request_timeout=args.timeout,
+        hedge_percentile=args.hedge,
+        hedge_budget=args.hedge_budget,
+        dedupe_threshold=args.dedupe,
+        compress_ratio=args.compress,
+        # Relative paths only name the same document from the same directory
+        manifest_owner=os.getcwd(),
+    )
+
+    texts = Ingestor().ingest(files)
+    segmented = segment_files(
+        texts, args.chunk_size, args.model, args.chunk_mode, args.chunk_overlap
+    )
+    chunks = []
+    manifests = ManifestStore() if run_params.use_cache else None
+    settings = settings_hash(role, llm_params, run_params)
+    compressor = Compressor(args.model, args.compress) if args.compress < 1 else None
+    for path, (file_chunks, total_tokens, seconds) in zip(files, segmented):
+        line = f"{path}: {len(file_chunks)} chunks, {total_tokens} tokens, {seconds:.2f}s"
+        if compressor is not None:
+            file_chunks = compressor.compress(file_chunks)
+            line += f", compressed to {sum(chunk.tokens for chunk in file_chunks)} tokens"
+        changed = (
+            manifests.changed(run_params.manifest_owner, path, file_chunks, settings)
+            if manifests is not None
+            else None
+        )
+        if changed is not None:
+            line += f", {len(changed)} changed since the last summary"
+        print(line, file=sys.stderr)
+        for chunk in file_chunks:
+            chunk.set_filename_from_list(files)
+        chunks.extend(file_chunks)
+    if manifests is not None:
+        manifests.close()
+    chunks = sort_chunks(chunks)
+    print(f"{len(files)} files, {len(chunks)} chunks", file=sys.stderr)
+
+    system = system_prompt(role, run_params.shared_context)
+    role_tokens = len(Tokenizer(args.model).tokenize(system))
+    plan = Planner(llm_params, run_params, role_tokens).plan(chunks)
+    print(
+        f"Estimate: {plan.requests} requests, {plan.worst_tokens} tokens at most, "
+        f"expected ${round(plan.expected_cost, 4)} (worst ${round(plan.worst_cost, 4)}), "
+        f"about {round(plan.expected_seconds)}s before cache hits",
+        file=sys.stderr,
+    )
+    if args.plan:
+        return 0
+
+    pipeline = Pipeline(args.api_key, llm_params, run_params, role)
+    completed = 0
+
+    def on_summary(index: int, summary: Summary) -> None:
+        nonlocal completed
+        completed += 1
+        print(f"[{completed}/{len(chunks)}] {summary.chunk.filename}", file=sys.stderr)
+
+    def on_submitted(batch_id: str) -> None:
+        print(f"Batch {batch_id} (resume with --batch-id {batch_id})", file=sys.stderr)
+
+    def on_status(status: str, completed: int, total: int) -> None:
+        print(f"Batch {status}: {completed}/{total}", file=sys.stderr)
+
+    async def run():
+        if args.batch or args.batch_id:
+            job = BatchJob(args.api_key, llm_params, args.base_url, args.poll_interval)
+            summaries = await pipeline.summarize_batch(
+                chunks, job, args.batch_id, on_submitted, on_status, on_summary
+            )
+        else:
+            summaries = await pipeline.summarize(chunks, on_summary)
+        failed = [summary for summary in summaries if summary.error]
+        for summary in failed:
+            print(f"Failed: {summary.chunk.filename}: {summary.error}", file=sys.stderr)
+        summaries = [summary for summary in summaries if not summary.error]
+        reduced = {}
+        if run_params.summary_mode == "map-reduce":
+            reduced = await pipeline.reduce(summaries)
+            for filename, error in pipeline.reduce_errors.items():
+                print(f"Failed to merge: {filename}: {error}", file=sys.stderr)
+        return summaries, reduced, len(failed)
+
+    try:
+        summaries, reduced, failed = run_pooled(run())
+    except BudgetExceeded as e:
+        print(f"Not submitted: {e}", file=sys.stderr)
+        return 1
+    summary_dicts = [summary.to_dict() for summary in summaries]
+    reduced_dicts = [{"filename": f, "content": c} for f, c in reduced.items()]
+    serialize = serialize_jsonl if args.format == "jsonl" else serialize_markdown
+    output = serialize(summary_dicts, reduced_dicts)
+
+    if args.output:
+        io.write_text_file(args.output, output)
+    else:
+        sys.stdout.write(output)
+    print(
+        f"Done. Total price: ${round(pipeline.total_price, 6)}, "
+        f"cache hits: {pipeline.cache_hits}, resumed: {pipeline.resumed} "
+        f"(${round(pipeline.resumed_price, 6)} paid earlier), failed: {failed}",
+        file=sys.stderr,
+    )
+    if pipeline.prompt_tokens:
+        print(
+            f"Prompt tokens: {pipeline.prompt_tokens}, cached: {pipeline.cached_tokens} "
+            f"({pipeline.cached_tokens / pipeline.prompt_tokens:.0%}), warm-up requests: "
+            f"{pipeline.warmed}",
+            file=sys.stderr,
+        )
+    if pipeline.hedging or pipeline.scheduler.timeouts:
+        hedges = pipeline.hedging.hedges if pipeline.hedging else 0
+        wins = pipeline.hedging.wins if pipeline.hedging else 0
+        print(
+            f"Hedged requests: {hedges} ({wins} won, "
+            f"${round(pipeline.budget.hedge_price, 6)} spent on losers), "
+            f"timeouts: {pipeline.scheduler.timeouts}",
+            file=sys.stderr,
+        )
+    if pipeline.duplicates:
+        print(
+            f"Duplicates: {pipeline.duplicates} requests avoided, "
+            f"{pipeline.dedupe_saved_tokens} tokens (${round(pipeline.dedupe_saved_price, 6)})",
+            file=sys.stderr,
+        )
+    if pipeline.packed_requests:
+        print(
+            f"Packed {pipeline.packed_documents} files into {pipeline.packed_requests} "
+            f"requests, {pipeline.unpacked} sent on their own",
+            file=sys.stderr,
+        )
+    stats = pipeline.telemetry.stats()
+    if stats["requests"]:
+        latency = "/".join(f"{value or 0:.2f}" for value in stats["latency"].values())
+        queue_wait = "/".join(f"{value or 0:.2f}" for value in stats["queue_wait"].values())
+        print(
+            f"Latency p50/p95/p99: {latency}s, waiting for a slot: {queue_wait}s, "
+            f"{stats['output_tokens_per_second']:.0f} output tokens/s",
+            file=sys.stderr,
+        )
+    pipeline.telemetry.write(args.telemetry, args.metrics)
+    return 1 if failed else 0
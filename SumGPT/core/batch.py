@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from datamodel.chunk import Chunk
+from datamodel.llm_params import LLMParams
+from openai import AsyncOpenAI
+
+BATCH_DIR = ".cache/batches"
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_DISCOUNT = 0.5  # Batch API requests are billed at half price
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchResult:
+    def __init__(
+        self,
+        content: str = "",
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cached_tokens: int = 0,
+        error: Optional[str] = None,
+    ):
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.error = error
+
+
+class BatchJob:
+    def __init__(
+        self,
+        api_key: str,
+        llm_params: LLMParams,
+        base_url: Optional[str] = None,
+        poll_interval: float = 30.0,
+    ):
+        """Summarize chunks through the OpenAI Batch API. `base_url` overrides the model's
+        backend, e.g. to point at a local stub server."""
+        self.llm_params = llm_params
+        self.poll_interval = poll_interval
+        backend = llm_params.model.backend
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url if base_url else backend.base_url,
+            default_headers=backend.headers or None,
+        )
+
+    @staticmethod
+    def custom_id(chunk: Chunk) -> str:
+        return f"{chunk.input_id}-{chunk.id}"
+
+    def write_requests(self, chunks: List[Chunk], systems: List[str]) -> str:
+        """Write one chat completion request per chunk to a JSONL file and return its path.
+        `systems` holds the system prompt of each chunk."""
+        lines = []
+        for chunk, system in zip(chunks, systems):
+            body = {
+                "model": self.llm_params.model.name,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": chunk.content},
+                ],
+                "max_tokens": self.llm_params.max_tokens,
+                "temperature": self.llm_params.temperature,
+            }
+            request = {
+                "custom_id": self.custom_id(chunk),
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": body,
+            }
+            lines.append(json.dumps(request, ensure_ascii=False))
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+
+        os.makedirs(BATCH_DIR, exist_ok=True)
+        path = os.path.join(BATCH_DIR, f"{hashlib.sha256(data).hexdigest()[:16]}.jsonl")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    async def submit(self, chunks: List[Chunk], systems: List[str]) -> str:
+        """Upload the request file, create the batch and return its id."""
+        path = self.write_requests(chunks, systems)
+        with open(path, "rb") as f:
+            input_file = await self.client.files.create(file=f, purpose="batch")
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    async def wait(
+        self, batch_id: str, on_status: Optional[Callable[[str, int, int], None]] = None
+    ):
+        """Poll until the batch reaches a terminal status. `on_status(status, completed,
+        total)` is called after every poll."""
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if on_status:
+                counts = batch.request_counts
+                completed, total = (counts.completed, counts.total) if counts else (0, 0)
+                on_status(batch.status, completed, total)
+            if batch.status in TERMINAL_STATUSES:
+                return batch
+            await asyncio.sleep(self.poll_interval)
+
+    async def results(self, batch) -> Dict[str, BatchResult]:
+        """Download the output and error files of a finished batch, keyed by custom_id."""
+        results: Dict[str, BatchResult] = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            content = await self.client.files.content(file_id)
+            for line in content.text.splitlines():
+                if line.strip():
+                    custom_id, result = self._parse_line(json.loads(line))
+                    results[custom_id] = result
+        return results
+
+    def _parse_line(self, line: dict) -> Tuple[str, BatchResult]:
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            # Failed lines may have a null body
+            error = line.get("error") or (response.get("body") or {}).get("error")
+            if not error:
+                error = f"status {response.get('status_code')}"
+            return line["custom_id"], BatchResult(error=json.dumps(error))
+
+        body = response["body"]
+        usage = body.get("usage", {})
+        return line["custom_id"], BatchResult(
+            content=body["choices"][0]["message"]["content"],
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+        )
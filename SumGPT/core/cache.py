@@ -0,0 +1,96 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Optional
+
+DEFAULT_CACHE_PATH = ".cache/summaries.db"
+
+
+class CachedSummary:
+    def __init__(
+        self, content: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0
+    ):
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+
+
+class SummaryCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 10000):
+        """Persistent, content-addressed summary cache with LRU eviction."""
+        self.path = path
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, "
+                "content TEXT NOT NULL, "
+                "prompt_tokens INTEGER NOT NULL, "
+                "completion_tokens INTEGER NOT NULL, "
+                "cached_tokens INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_last_access ON summaries (last_access)"
+            )
+
+    @staticmethod
+    def make_key(
+        content: str, role: str, model: str, temperature: float, max_tokens: int
+    ) -> str:
+        """Hash everything that determines a summary. `role` must already have
+        `$(LANGUAGE)` substituted."""
+        payload = json.dumps(
+            [content, role, model, temperature, max_tokens], ensure_ascii=False
+        ).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str) -> Optional[CachedSummary]:
+        row = self._conn.execute(
+            "SELECT content, prompt_tokens, completion_tokens, cached_tokens "
+            "FROM summaries WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute(
+                "UPDATE summaries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+        return CachedSummary(*row)
+
+    def put(self, key: str, summary: CachedSummary) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    summary.content,
+                    summary.prompt_tokens,
+                    summary.completion_tokens,
+                    summary.cached_tokens,
+                    time.time(),
+                ),
+            )
+            # Evict least recently used entries beyond the size cap
+            self._conn.execute(
+                "DELETE FROM summaries WHERE key IN ("
+                "SELECT key FROM summaries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM summaries")
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,143 @@
+import re
+import zlib
+from typing import List, Optional, Set, Tuple
+
+from core.tokenizer import Tokenizer
+
+# Boundary patterns from coarsest to finest. Markdown headings split *before* the match,
+# the others split *after* it, so the pieces always concatenate back to the source text.
+# Pieces end at a run of newlines or before other whitespace, never inside a pre-token
+# (a space belongs to the word after it), so their token counts add up to the text's.
+_HEADING = re.compile(r"^#{1,6}[ \t]", re.MULTILINE)
+_PARAGRAPH = re.compile(r"\n[ \t]*\n(?:\s*\n)?")
+_SENTENCE = re.compile(
+    r"[.!?]+[\"')\]]*(?=[^\S\n])|[。！？]+[”’」』）]*(?:\n(?:\s*\n)?)?|\n(?:\s*\n)?"
+)
+
+LEVELS = ["markdown", "paragraph", "sentence"]
+
+# Content-defined chunking: a chunk ends after a sentence whose trailing characters hash
+# below a threshold, so boundaries depend only on nearby text and survive edits elsewhere
+CONTENT_WINDOW = 64  # characters hashed before each sentence edge
+CONTENT_TARGET_RATIO = 0.6  # of chunk_size, average distance between content boundaries
+CONTENT_MIN_RATIO = 0.3  # of chunk_size, content boundaries closer than this are skipped
+
+
+class Chunker:
+    MODES = ["tokens"] + LEVELS + ["content"]
+
+    def __init__(self, model: str, chunk_size: int, mode: str = "tokens", overlap: int = 0):
+        """Split text into chunks of at most `chunk_size` tokens.
+
+        `tokens` cuts at fixed token offsets. The structural modes cut at markdown headings,
+        paragraphs or sentences and greedily pack those units up to `chunk_size`; units that
+        are still too large fall back to the next finer boundary and finally to tokens.
+        `content` packs sentences like `sentence` but also cuts where the text itself says so,
+        keeping most boundaries in place when the document is edited elsewhere.
+        `overlap` repeats up to that many trailing tokens of a chunk at the start of the next."""
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown chunking mode: {mode}")
+        self.tokenizer = Tokenizer(model)
+        self.chunk_size = chunk_size
+        self.mode = mode
+        self.overlap = min(overlap, chunk_size // 2)
+
+    def split(self, text: str) -> Tuple[List[Tuple[int, int, int]], int]:
+        """Return (start, end, tokens) character spans of the chunks of `text` and its
+        total token count. Spans index into `text`, so no chunk content is copied."""
+        if self.mode == "tokens":
+            return self.tokenizer.split_spans(text, self.chunk_size, self.overlap)
+
+        if self.mode == "content":
+            units = self._units(text, 0, len(text), LEVELS.index("sentence"))
+            chunks = self._pack(units, self._content_boundaries(text, units))
+            return chunks, sum(tokens for _, _, tokens in units)
+
+        units = self._units(text, 0, len(text), LEVELS.index(self.mode))
+        return self._pack(units), sum(tokens for _, _, tokens in units)
+
+    def _content_boundaries(self, text: str, units: List[Tuple[int, int, int]]) -> Set[int]:
+        """Return the indices of the units a content-defined chunk may end with."""
+        # The chance of a boundary grows with the unit's tokens, for one boundary per
+        # `target` tokens on average however long the sentences are
+        target = max(1.0, self.chunk_size * CONTENT_TARGET_RATIO)
+        boundaries = set()
+        for index, (_, end, tokens) in enumerate(units):
+            window = text[max(0, end - CONTENT_WINDOW) : end].encode("utf-8")
+            if zlib.crc32(window) / 2**32 < tokens / target:
+                boundaries.add(index)
+        return boundaries
+
+    def _units(self, text: str, start: int, end: int, level: int) -> List[Tuple[int, int, int]]:
+        spans = split_units(text, LEVELS[level], start, end)
+        # Tokenize all pieces of this level in one batched call
+        counts = [
+            len(tokens)
+            for tokens in self.tokenizer.tokenizer.encode_batch(
+                [text[a:b] for a, b in spans], disallowed_special=()
+            )
+        ]
+        units: List[Tuple[int, int, int]] = []
+        for (a, b), count in zip(spans, counts):
+            if count <= self.chunk_size:
+                units.append((a, b, count))
+            elif level + 1 < len(LEVELS):
+                units.extend(self._units(text, a, b, level + 1))
+            else:
+                pieces, _ = self.tokenizer.split_spans(text[a:b], self.chunk_size)
+                units.extend((a + p, a + q, tokens) for p, q, tokens in pieces)
+        return units
+
+    def _pack(
+        self, units: List[Tuple[int, int, int]], boundaries: Optional[Set[int]] = None
+    ) -> List[Tuple[int, int, int]]:
+        # Units are contiguous, so a run of them spans from the first start to the last end
+        chunks: List[Tuple[int, int, int]] = []
+        current: List[Tuple[int, int, int]] = []
+        current_tokens = 0
+        min_tokens = self.chunk_size * CONTENT_MIN_RATIO
+        for index, unit in enumerate(units):
+            count = unit[2]
+            at_boundary = (
+                boundaries is not None and index - 1 in boundaries and current_tokens >= min_tokens
+            )
+            if current and (at_boundary or current_tokens + count > self.chunk_size):
+                chunks.append((current[0][0], current[-1][1], current_tokens))
+                current, current_tokens = self._carry_over(current)
+                # Drop overlap that would push the next chunk past the budget
+                while current and current_tokens + count > self.chunk_size:
+                    current_tokens -= current.pop(0)[2]
+            current.append(unit)
+            current_tokens += count
+        if current:
+            chunks.append((current[0][0], current[-1][1], current_tokens))
+        return chunks
+
+    def _carry_over(
+        self, units: List[Tuple[int, int, int]]
+    ) -> Tuple[List[Tuple[int, int, int]], int]:
+        carried: List[Tuple[int, int, int]] = []
+        carried_tokens = 0
+        for unit in reversed(units):
+            if carried_tokens + unit[2] > self.overlap:
+                break
+            carried.insert(0, unit)
+            carried_tokens += unit[2]
+        return carried, carried_tokens
+
+
+def split_units(text: str, level: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """Return the (start, end) spans of the pieces of `text[start:end]` at `level`."""
+    if level == "markdown":
+        cuts = [m.start() for m in _HEADING.finditer(text, start, end)]
+    elif level == "paragraph":
+        cuts = [m.end() for m in _PARAGRAPH.finditer(text, start, end)]
+    else:
+        cuts = [m.end() for m in _SENTENCE.finditer(text, start, end)]
+
+    spans = []
+    for cut in cuts + [end]:
+        if cut > start:
+            spans.append((start, cut))
+            start = cut
+    return spans
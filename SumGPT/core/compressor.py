@@ -0,0 +1,116 @@
+import re
+from itertools import chain
+from typing import List, Tuple
+
+import numpy as np
+
+from core.chunker import split_units
+from core.tokenizer import Tokenizer
+from datamodel.chunk import Chunk
+
+MIN_SENTENCES = 4  # chunks with fewer sentences are sent as they are
+DAMPING = 0.85  # TextRank damping factor
+ITERATIONS = 30  # at most, power iterations
+TOLERANCE = 1e-6  # total rank change at which the iteration stops
+
+_WORD = re.compile(r"\w+")
+_HEADING = re.compile(r"\s*#{1,6}\s")
+
+
+class Compressor:
+    def __init__(self, model: str, ratio: float):
+        """Drop the least informative sentences of each chunk until about `ratio` of its
+        tokens are left, without calling any model. Sentences are ranked by TextRank over
+        their TF-IDF similarity, scaled down for mostly non-alphabetic text such as tables
+        of numbers. Repeated sentences are dropped first; markdown headings and blank lines
+        are kept."""
+        self.tokenizer = Tokenizer(model)
+        self.ratio = ratio
+
+    def compress(self, chunks: List[Chunk]) -> List[Chunk]:
+        """Return compressed copies of `chunks`, each holding only its own text."""
+        compressed = []
+        for chunk in chunks:
+            content, tokens = self.compress_text(chunk.content)
+            if tokens >= chunk.tokens:
+                compressed.append(chunk)
+                continue
+            copy = Chunk(chunk.id, content, tokens, chunk.input_id)
+            copy.filename = chunk.filename
+            compressed.append(copy)
+        return compressed
+
+    def compress_text(self, text: str) -> Tuple[str, int]:
+        """Return the compressed text and its token count, counted per sentence."""
+        spans = split_units(text, "sentence", 0, len(text))
+        sentences = [text[start:end] for start, end in spans]
+        encoded = self.tokenizer.tokenizer.encode_batch(sentences, disallowed_special=())
+        counts = np.array([len(tokens) for tokens in encoded], dtype=np.int64)
+        if len(sentences) < MIN_SENTENCES or self.ratio >= 1:
+            return text, int(counts.sum())
+
+        scores = self._scores(sentences)
+        budget = self.ratio * counts.sum()
+        keep = np.zeros(len(sentences), dtype=bool)
+        kept_tokens = 0
+        for index in np.argsort(-scores, kind="stable"):
+            if kept_tokens >= budget or scores[index] <= 0:
+                break
+            keep[index] = True
+            kept_tokens += counts[index]
+        # Headings and blank lines cost little and keep the structure of what is left
+        for index, sentence in enumerate(sentences):
+            if _HEADING.match(sentence) or not sentence.strip():
+                keep[index] = True
+        return "".join(s for s, k in zip(sentences, keep) if k), int(counts[keep].sum())
+
+    def _scores(self, sentences: List[str]) -> np.ndarray:
+        n = len(sentences)
+        words = [_WORD.findall(sentence.lower()) for sentence in sentences]
+        flat = list(chain.from_iterable(words))
+        vocabulary = {word: i for i, word in enumerate(dict.fromkeys(flat))}
+        v = max(1, len(vocabulary))
+        rows = np.repeat(np.arange(n, dtype=np.int64), [len(w) for w in words])
+        columns = np.fromiter(map(vocabulary.__getitem__, flat), np.int64, len(flat))
+
+        seen = set()
+        repeated = np.zeros(n, dtype=bool)
+        for row, sentence_words in enumerate(words):
+            key = tuple(sentence_words)
+            repeated[row] = key in seen
+            seen.add(key)
+
+        # TF-IDF vectors as a sparse sentence x word matrix of (row, column, value) triples;
+        # a dense one would not fit in memory for chunks of thousands of sentences
+        keys, tf = np.unique(rows * v + columns, return_counts=True)
+        rows, columns = keys // v, keys % v
+        idf = np.log((1 + n) / (1 + np.bincount(columns, minlength=v))) + 1
+        values = tf * idf[columns]
+        self_similarity = np.bincount(rows, weights=values**2, minlength=n)
+        values /= np.sqrt(self_similarity)[rows]
+        self_similarity = np.bincount(rows, weights=values**2, minlength=n)
+
+        def similarity_dot(x: np.ndarray) -> np.ndarray:
+            # (V V^T - diag) x without forming the n x n cosine similarity matrix
+            y = np.bincount(columns, weights=values * x[rows], minlength=v)
+            return np.bincount(rows, weights=values * y[columns], minlength=n) - self_similarity * x
+
+        # TextRank: PageRank over the cosine similarity graph of the sentences. Sentences
+        # similar to no other spread their rank evenly.
+        totals = similarity_dot(np.ones(n))
+        isolated = totals <= 1e-12
+        totals[isolated] = 1
+        rank = np.full(n, 1 / n)
+        for _ in range(ITERATIONS):
+            spread = np.where(isolated, 0, rank / totals)
+            previous = rank
+            rank = (1 - DAMPING) / n + DAMPING * (similarity_dot(spread) + rank[isolated].sum() / n)
+            if np.abs(rank - previous).sum() < TOLERANCE:
+                break
+
+        # Share of letters among visible characters, low for numbers, code and tables
+        letters = np.array([sum(map(str.isalpha, s)) for s in sentences], dtype=np.float64)
+        visible = np.array([len(s) - s.count(" ") for s in sentences], dtype=np.float64)
+        scores = rank * letters / np.maximum(visible, 1)
+        scores[repeated] = 0
+        return scores
@@ -0,0 +1,95 @@
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.85  # estimated Jaccard similarity of near-duplicates
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16  # of NUM_PERMUTATIONS // LSH_BANDS rows; catches pairs above ~0.7 similarity
+SHINGLE_WORDS = 3
+SEED = 1
+
+_WORD = re.compile(r"\w+")
+_MASK = np.uint64((1 << 32) - 1)
+
+
+class Deduplicator:
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        """Find chunks that are identical or nearly so: exact duplicates by hash, near
+        duplicates by MinHash signatures over word shingles, with locality-sensitive
+        hashing so only chunks sharing a band of their signature are compared."""
+        self.threshold = threshold
+        # Multiply-shift hashing, (a * x + b) mod 2^64 >> 32, stands in for permutations;
+        # uint64 arithmetic wraps, which is exactly the mod 2^64
+        rng = np.random.default_rng(SEED)
+        self._a = rng.integers(0, 1 << 64, NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 1 << 64, NUM_PERMUTATIONS, dtype=np.uint64)
+        self._vocabulary: Dict[str, int] = {}
+
+    def duplicates(self, contents: List[str]) -> Dict[int, int]:
+        """Map the index of every duplicate in `contents` to the index of the first
+        member of its cluster, which stands in for the rest. Members of a cluster are
+        linked by a chain of similar pairs, each at least `threshold` similar."""
+        parent = list(range(len(contents)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i: int, j: int) -> None:
+            i, j = find(i), find(j)
+            if i != j:
+                parent[max(i, j)] = min(i, j)
+
+        first_by_hash: Dict[str, int] = {}
+        unique: List[int] = []
+        for index, content in enumerate(contents):
+            digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            if digest in first_by_hash:
+                union(first_by_hash[digest], index)
+            else:
+                first_by_hash[digest] = index
+                unique.append(index)
+
+        signatures = {}
+        for index in unique:
+            signature = self.signature(contents[index])
+            if signature is not None:
+                signatures[index] = signature
+
+        rows = NUM_PERMUTATIONS // LSH_BANDS
+        for band in range(LSH_BANDS):
+            buckets: Dict[bytes, List[int]] = {}
+            for index, signature in signatures.items():
+                key = signature[band * rows : (band + 1) * rows].tobytes()
+                buckets.setdefault(key, []).append(index)
+            for members in buckets.values():
+                for other in members[1:]:
+                    if find(members[0]) == find(other):
+                        continue
+                    similarity = np.mean(signatures[members[0]] == signatures[other])
+                    if similarity >= self.threshold:
+                        union(members[0], other)
+
+        return {i: find(i) for i in range(len(contents)) if find(i) != i}
+
+    def signature(self, content: str) -> Optional[np.ndarray]:
+        """Return the MinHash signature of `content`, or None if it is too short to
+        have a shingle."""
+        words = _WORD.findall(content.lower())
+        if len(words) < SHINGLE_WORDS:
+            return None
+        # Number words by first appearance; ids only need to be consistent within a run
+        vocabulary = self._vocabulary
+        ids = np.array([vocabulary.setdefault(w, len(vocabulary)) for w in words], np.uint64)
+        # Combine consecutive word ids into one 32-bit hash per shingle
+        shingles = np.zeros(len(words) - SHINGLE_WORDS + 1, dtype=np.uint64)
+        for offset in range(SHINGLE_WORDS):
+            part = ids[offset : len(ids) - SHINGLE_WORDS + 1 + offset]
+            shingles = (shingles * np.uint64(1000003) + part) & _MASK
+        shingles = np.unique(shingles)
+        permuted = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1)
@@ -0,0 +1,118 @@
+import codecs
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple
+
+import docx
+from PyPDF4 import PdfFileReader
+
+TEXT_EXTENSIONS = (".txt", ".md")
+EXTENSIONS = TEXT_EXTENSIONS + (".pdf", ".docx")
+
+READ_BLOCK_SIZE = 1 << 20  # bytes decoded per step
+PDF_PAGES_PER_TASK = 16  # pages extracted by one worker task
+
+
+def extension(filename: str) -> str:
+    return os.path.splitext(filename)[1].lower()
+
+
+def decode_text(stream: BinaryIO) -> str:
+    """Decode UTF-8 from `stream` block by block, so only one block of raw bytes is held
+    in memory at a time. Invalid bytes are replaced instead of failing the whole file."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    parts = []
+    while True:
+        block = stream.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        parts.append(decoder.decode(block))
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
+
+
+def read_text(path: str) -> str:
+    with open(path, "rb") as f:
+        return decode_text(f)
+
+
+# The functions below run in worker processes and must stay at module level to be picklable.
+# Each opens the file itself, so only the path crosses the process boundary.
+
+
+def _pdf_page_count(path: str) -> int:
+    with open(path, "rb") as f:
+        return PdfFileReader(f, strict=False).getNumPages()
+
+
+def _pdf_pages(path: str, start: int, end: int) -> str:
+    with open(path, "rb") as f:
+        reader = PdfFileReader(f, strict=False)
+        return "\n\n".join(reader.getPage(i).extractText() for i in range(start, end))
+
+
+def _docx_text(path: str) -> str:
+    document = docx.Document(path)
+    parts = [paragraph.text for paragraph in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            parts.append("\t".join(cell.text for cell in row.cells))
+    return "\n\n".join(part for part in parts if part.strip())
+
+
+class Ingestor:
+    def __init__(self, max_workers: Optional[int] = None):
+        """Extract plain text from txt, md, pdf and docx files. PDF page ranges and docx
+        files are parsed in parallel in a process pool; plain text is decoded in-process,
+        where it is cheaper than shipping the result back from a worker."""
+        self.max_workers = max_workers
+
+    def ingest(
+        self, paths: List[str], on_file: Optional[Callable[[int, str], None]] = None
+    ) -> List[str]:
+        """Return the text of every file in the order of `paths`. `on_file(index, path)`
+        is called as each file finishes."""
+        texts: List[Optional[str]] = [None] * len(paths)
+        documents = [i for i, path in enumerate(paths) if extension(path) not in TEXT_EXTENSIONS]
+        if documents:
+            with ProcessPoolExecutor(self.max_workers) as pool:
+                self._ingest_documents(pool, paths, documents, texts, on_file)
+
+        for index, path in enumerate(paths):
+            if texts[index] is None:
+                texts[index] = read_text(path)
+                if on_file:
+                    on_file(index, path)
+        return texts
+
+    def _ingest_documents(
+        self,
+        pool: ProcessPoolExecutor,
+        paths: List[str],
+        documents: List[int],
+        texts: List[Optional[str]],
+        on_file: Optional[Callable[[int, str], None]],
+    ) -> None:
+        page_counts: Dict[int, Future] = {}
+        parts: Dict[int, List[Future]] = {}
+        for index in documents:
+            if extension(paths[index]) == ".pdf":
+                page_counts[index] = pool.submit(_pdf_page_count, paths[index])
+            else:
+                parts[index] = [pool.submit(_docx_text, paths[index])]
+
+        # Split every PDF into page ranges once its page count is known
+        for index, future in page_counts.items():
+            parts[index] = [
+                pool.submit(_pdf_pages, paths[index], start, end)
+                for start, end in _page_ranges(future.result(), PDF_PAGES_PER_TASK)
+            ]
+
+        for index in documents:
+            texts[index] = "\n\n".join(future.result() for future in parts[index])
+            if on_file:
+                on_file(index, paths[index])
+
+
+def _page_ranges(pages: int, size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + size, pages)) for start in range(0, pages, size)]
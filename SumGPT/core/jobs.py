@@ -0,0 +1,290 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Awaitable, Dict, List, Optional, TypeVar
+
+from core.pipeline import Pipeline
+from core.scheduler import RequestScheduler
+from datamodel.chunk import Chunk
+from datamodel.llm_model import LLMModel
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+from datamodel.summary import Summary
+
+DEFAULT_JOBS_PATH = ".cache/jobs.db"
+JOB_RETENTION = 7 * 24 * 3600  # seconds finished jobs and their results are kept
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL_STATUSES = {DONE, FAILED, CANCELLED}
+
+T = TypeVar("T")
+
+
+class Job:
+    def __init__(
+        self,
+        id: str,
+        status: str,
+        total: int,
+        completed: int,
+        failed: int,
+        price: float,
+        error: Optional[str],
+        created: float,
+        finished: Optional[float],
+    ):
+        self.id = id
+        self.status = status
+        self.total = total
+        self.completed = completed
+        self.failed = failed
+        self.price = price
+        self.error = error
+        self.created = created
+        self.finished = finished
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+
+class JobStore:
+    def __init__(self, path: str = DEFAULT_JOBS_PATH):
+        """Status and results of background jobs, shared by the worker thread and every
+        session that polls them."""
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "status TEXT NOT NULL, "
+                "total INTEGER NOT NULL, "
+                "completed INTEGER NOT NULL DEFAULT 0, "
+                "failed INTEGER NOT NULL DEFAULT 0, "
+                "price REAL NOT NULL DEFAULT 0, "
+                "error TEXT, "
+                "created REAL NOT NULL, "
+                "finished REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                "job_id TEXT NOT NULL, "
+                "kind TEXT NOT NULL, "
+                "idx INTEGER NOT NULL, "
+                "filename TEXT, "
+                "content TEXT, "
+                "tokens INTEGER, "
+                "price REAL, "
+                "error TEXT)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS job_results_job_id ON job_results (job_id)"
+            )
+
+    def create(self, total: int) -> str:
+        job_id = uuid.uuid4().hex[:16]
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, total, created) VALUES (?, ?, ?, ?)",
+                (job_id, QUEUED, total, time.time()),
+            )
+        return job_id
+
+    def update(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        finished = time.time() if status in TERMINAL_STATUSES else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ? WHERE id = ?",
+                (status, error, finished, job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, total, completed, failed, price, error, created, finished "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        return Job(*row) if row else None
+
+    def add_summary(self, job_id: str, index: int, summary: Summary) -> None:
+        """Store a chunk summary and advance the job's progress counters."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO job_results (job_id, kind, idx, filename, content, tokens, price, "
+                "error) VALUES (?, 'chunk', ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    index,
+                    summary.chunk.filename,
+                    summary.content,
+                    summary.tokens,
+                    summary.price,
+                    summary.error,
+                ),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET completed = completed + 1, failed = failed + ?, "
+                "price = price + ? WHERE id = ?",
+                (1 if summary.error else 0, summary.price, job_id),
+            )
+
+    def add_combined(self, job_id: str, filename: str, content: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO job_results (job_id, kind, idx, filename, content) "
+                "VALUES (?, 'combined', 0, ?, ?)",
+                (job_id, filename, content),
+            )
+
+    def add_price(self, job_id: str, price: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE jobs SET price = price + ? WHERE id = ?", (price, job_id))
+
+    def summaries(self, job_id: str, since: int = 0) -> List[dict]:
+        """Return chunk summaries in completion order, skipping the first `since`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT idx, filename, content, tokens, price, error FROM job_results "
+                "WHERE job_id = ? AND kind = 'chunk' ORDER BY rowid LIMIT -1 OFFSET ?",
+                (job_id, since),
+            ).fetchall()
+        keys = ("index", "filename", "content", "tokens", "price", "error")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def combined(self, job_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT filename, content FROM job_results "
+                "WHERE job_id = ? AND kind = 'combined' ORDER BY rowid",
+                (job_id,),
+            ).fetchall()
+        return [{"filename": filename, "content": content} for filename, content in rows]
+
+    def interrupt_unfinished(self) -> None:
+        """Fail jobs a previous server process left unfinished; their chunks can be
+        resumed from the run journal by submitting them again."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = 'interrupted by a server restart', "
+                "finished = ? WHERE status IN (?, ?)",
+                (FAILED, time.time(), QUEUED, RUNNING),
+            )
+
+    def prune(self, max_age: float = JOB_RETENTION) -> None:
+        cutoff = time.time() - max_age
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM job_results WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE finished < ?)",
+                (cutoff,),
+            )
+            self._conn.execute("DELETE FROM jobs WHERE finished < ?", (cutoff,))
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class JobRunner:
+    def __init__(self, max_concurrency: int = 16, store: Optional[JobStore] = None):
+        """Run summarization jobs on a background event loop, independent of the script
+        run that submitted them. All jobs share one concurrency limit, and all jobs on the
+        same model share one rate-limit budget; so do foreground runs given `scheduler`."""
+        self.max_concurrency = max_concurrency
+        self.store = store if store else JobStore()
+        self.store.interrupt_unfinished()
+        self.store.prune()
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._schedulers: Dict[str, RequestScheduler] = {}
+        self._schedulers_lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        chunks: List[Chunk],
+        llm_params: LLMParams,
+        run_params: RunParams,
+        role: str,
+        api_key: str,
+    ) -> str:
+        """Queue a job and return its id. The API key is only held in memory."""
+        job_id = self.store.create(len(chunks))
+        coroutine = self._run(job_id, chunks, llm_params, run_params, role, api_key)
+        self._futures[job_id] = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        return job_id
+
+    def run(self, coroutine: Awaitable[T]) -> "Future[T]":
+        """Run a foreground coroutine on the worker loop. Unlike a loop of its own, the
+        worker loop outlives the run, and so do the pooled connections it opens."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def cancel(self, job_id: str) -> None:
+        future = self._futures.get(job_id)
+        # A job cancelled before it starts never reaches its own status update
+        if future is not None and future.cancel():
+            self.store.update(job_id, CANCELLED)
+
+    def scheduler(self, model: LLMModel) -> RequestScheduler:
+        """The scheduler of `model` shared by all jobs and foreground runs. It may only be
+        used by coroutines on the worker loop, see `run`."""
+        with self._schedulers_lock:
+            scheduler = self._schedulers.get(model.name)
+            if scheduler is None:
+                scheduler = RequestScheduler(
+                    self.max_concurrency, model.limits, semaphore=self._semaphore
+                )
+                self._schedulers[model.name] = scheduler
+        return scheduler
+
+    async def _run(
+        self,
+        job_id: str,
+        chunks: List[Chunk],
+        llm_params: LLMParams,
+        run_params: RunParams,
+        role: str,
+        api_key: str,
+    ) -> None:
+        self.store.update(job_id, RUNNING)
+        try:
+            scheduler = self.scheduler(llm_params.model)
+            pipeline = Pipeline(api_key, llm_params, run_params, role, scheduler)
+
+            def on_summary(index: int, summary: Summary) -> None:
+                self.store.add_summary(job_id, index, summary)
+
+            summaries = await pipeline.summarize(chunks, on_summary)
+            if run_params.summary_mode == "map-reduce":
+                reduced = await pipeline.reduce(summaries)
+                for filename, content in reduced.items():
+                    self.store.add_combined(job_id, filename, content)
+                self.store.add_price(job_id, pipeline.reducer.price)
+            # Requests cancelled in flight were billed without a summary carrying the price
+            self.store.add_price(job_id, pipeline.budget.abandoned_price)
+            merge_errors = [f"{f}: {error}" for f, error in pipeline.reduce_errors.items()]
+            self.store.update(
+                job_id, DONE, "Failed to merge " + "; ".join(merge_errors) if merge_errors else None
+            )
+        except asyncio.CancelledError:
+            self.store.update(job_id, CANCELLED)
+            raise
+        except Exception as e:
+            self.store.update(job_id, FAILED, f"{type(e).__name__}: {e}")
+        finally:
+            self._futures.pop(job_id, None)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from datamodel.summary import Summary
+
+DEFAULT_JOURNAL_PATH = ".cache/journal.db"
+JOURNAL_RETENTION = 7 * 24 * 3600  # seconds entries of unfinished runs are kept
+
+
+class JournalEntry:
+    def __init__(
+        self,
+        content: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int,
+        price: float,
+    ):
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.price = price
+
+
+class RunJournal:
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        """Append-only record of every chunk a run completes or fails, written the moment
+        it happens, so an interrupted run can be resumed. A run's entries are forgotten
+        once it completes, and those of runs never completed expire."""
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "run_id TEXT NOT NULL, "
+                "chunk_hash TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "content TEXT, "
+                "prompt_tokens INTEGER, "
+                "completion_tokens INTEGER, "
+                "cached_tokens INTEGER, "
+                "price REAL, "
+                "error TEXT, "
+                "created REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS journal_run_id ON journal (run_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS journal_created ON journal (created)")
+
+    @staticmethod
+    def make_run_id(chunk_hashes: List[str]) -> str:
+        """A run is identified by the ordered hashes of its chunks, which already cover the
+        role, model and generation parameters."""
+        return hashlib.sha256("\n".join(chunk_hashes).encode("utf-8")).hexdigest()[:16]
+
+    def completed(self, run_id: str) -> Dict[str, JournalEntry]:
+        """Return the successfully completed chunks of a run, keyed by chunk hash."""
+        rows = self._conn.execute(
+            "SELECT chunk_hash, content, prompt_tokens, completion_tokens, cached_tokens, price "
+            "FROM journal WHERE run_id = ? AND status = 'ok' ORDER BY id",
+            (run_id,),
+        ).fetchall()
+        return {row[0]: JournalEntry(*row[1:]) for row in rows}
+
+    def record(self, run_id: str, chunk_hash: str, summary: Summary) -> None:
+        status = "failed" if summary.error else "ok"
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO journal (run_id, chunk_hash, status, content, prompt_tokens, "
+                "completion_tokens, cached_tokens, price, error, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id,
+                    chunk_hash,
+                    status,
+                    summary.content,
+                    summary.prompt_tokens,
+                    summary.completion_tokens,
+                    summary.cached_tokens,
+                    summary.price,
+                    summary.error,
+                    time.time(),
+                ),
+            )
+
+    def forget(self, run_id: Optional[str] = None) -> None:
+        """Delete the entries of one run, or of every run."""
+        with self._conn:
+            if run_id is None:
+                self._conn.execute("DELETE FROM journal")
+            else:
+                self._conn.execute("DELETE FROM journal WHERE run_id = ?", (run_id,))
+
+    def prune(self, max_age: float = JOURNAL_RETENTION) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM journal WHERE created < ?", (time.time() - max_age,))
+
+    def close(self) -> None:
+        self._conn.close()
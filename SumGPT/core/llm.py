@@ -1,21 +1,115 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Dict, Optional, Tuple, TypeVar
+
+import httpx
+from datamodel.llm_model import LLMBackend
 from datamodel.llm_params import LLMParams
-from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessageChunk, BaseMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from pydantic.types import SecretStr
 
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+KEEPALIVE_EXPIRY = 60.0  # seconds an idle connection is kept open
+
+_clients: Dict[tuple, httpx.Client] = {}
+# Async connections belong to the event loop that opened them, so async pools are per loop
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+T = TypeVar("T")
+
+
+def _limits(backend: LLMBackend) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=backend.max_connections,
+        max_keepalive_connections=backend.max_connections,
+        keepalive_expiry=KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client(backend: LLMBackend) -> httpx.Client:
+    """Return the process-wide keep-alive client of `backend`."""
+    with _clients_lock:
+        client = _clients.get(backend.key)
+        if client is None:
+            client = httpx.Client(http2=HTTP2, limits=_limits(backend))
+            _clients[backend.key] = client
+    return client
+
+
+def get_async_client(backend: LLMBackend, loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+    """Return the keep-alive async client of `backend` for `loop`, shared by every request
+    made on that loop. Connections are only reused for the life of the loop: one run of
+    the CLI, or the process for the web UI, whose runs all go on the job runner's loop."""
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(backend.key)
+        if client is None:
+            client = httpx.AsyncClient(http2=HTTP2, limits=_limits(backend))
+            clients[backend.key] = client
+    return client
+
+
+async def close_async_clients() -> None:
+    """Close the async clients of the running loop, which can't be closed once it ends."""
+    with _clients_lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def run_pooled(coroutine: Awaitable[T]) -> T:
+    """`asyncio.run` that closes the loop's pooled async clients before the loop ends."""
+
+    async def main() -> T:
+        try:
+            return await coroutine
+        finally:
+            await close_async_clients()
+
+    return asyncio.run(main())
+
 
 class LLM:
     def __init__(self, api_key: str, gpt_params: LLMParams):
         self.api_key: str = api_key
         self.llm_params: LLMParams = gpt_params
-        self.model: ChatOpenAI = self._set_llm()
+        self._model: Optional[ChatOpenAI] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
 
-    def _set_llm(self) -> ChatOpenAI:
+    @property
+    def model(self) -> ChatOpenAI:
+        """The chat model bound to the pooled clients of the current event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self._model is None or self._loop is not loop:
+            self._model = self._set_llm(loop)
+            self._loop = loop
+        return self._model
+
+    def _set_llm(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> ChatOpenAI:
+        backend = self.llm_params.model.backend
         return ChatOpenAI(
             api_key=SecretStr(self.api_key),
             model=self.llm_params.model.name,
             max_tokens=self.llm_params.max_tokens,
             temperature=self.llm_params.temperature,
+            max_retries=0,  # retries are handled by core.scheduler.RequestScheduler
+            stream_usage=True,  # report token usage on the final streamed chunk
+            base_url=backend.base_url,
+            default_headers=backend.headers or None,
+            http_client=get_client(backend),
+            http_async_client=get_async_client(backend, loop) if loop else None,
         )
 
     def generate(_self, prompt: str, system: str = "") -> BaseMessage:
@@ -25,13 +119,47 @@ class LLM:
         ]
         return _self.model.invoke(messages)
 
-    async def agenerate(_self, prompt: str, system: str = "") -> BaseMessage:
+    async def agenerate(
+        _self, prompt: str, system: str = "", max_tokens: Optional[int] = None
+    ) -> BaseMessage:
+        """`max_tokens` overrides the output limit of `llm_params` for this request."""
         messages = [
             SystemMessage(content=system),
             HumanMessage(content=prompt),
         ]
+        if max_tokens is not None:
+            return await _self.model.ainvoke(messages, max_tokens=max_tokens)
         return await _self.model.ainvoke(messages)
 
+    async def astream(_self, prompt: str, system: str = "") -> AsyncIterator[AIMessageChunk]:
+        """Yield message chunks as tokens arrive. The final chunk carries `usage_metadata`,
+        so summing all chunks gives a complete message with token usage."""
+        messages = [
+            SystemMessage(content=system),
+            HumanMessage(content=prompt),
+        ]
+        async for chunk in _self.model.astream(messages):
+            yield chunk
+
+    def get_tokens(self, message: BaseMessage) -> Tuple[int, int, int]:
+        """Return (completion, prompt, cached) token counts of a response message."""
+        # Streamed messages only report usage through `usage_metadata`
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return self._get_response_tokens(message.response_metadata)
+        completion_tokens = usage.get("output_tokens", 0)
+        prompt_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        return completion_tokens, prompt_tokens, cached_tokens
+
+    def _get_response_tokens(self, response_meta: Dict[str, Any]) -> Tuple[int, int, int]:
+        completion_tokens = response_meta.get("token_usage", {}).get("completion_tokens", 0)
+        prompt_tokens = response_meta.get("token_usage", {}).get("prompt_tokens", 0)
+        cached_tokens = (
+            response_meta.get("token_usage", {}).get("prompt_tokens_details") or {}
+        ).get("cached_tokens", 0)
+        return completion_tokens, prompt_tokens, cached_tokens
+
     def Calc_price(
         self,
         input_tokens: int,
@@ -39,13 +167,6 @@ class LLM:
         cached_tokens: int = 0,
         scale_factor: int = 1000000,
     ) -> float:
-        pricing = self.llm_params.model.pricing
-        if cached_tokens != 0 and pricing.cached is not None:
-            input_tokens -= cached_tokens
-            return (
-                input_tokens * pricing.input
-                + output_tokens * pricing.output
-                + cached_tokens * pricing.cached
-            ) / scale_factor
-
-        return (input_tokens * pricing.input + output_tokens * pricing.output) / scale_factor
+        return self.llm_params.model.pricing.calc_price(
+            input_tokens, output_tokens, cached_tokens, scale_factor
+        )
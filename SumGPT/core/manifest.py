@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from datamodel.chunk import Chunk
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+
+DEFAULT_MANIFEST_PATH = ".cache/manifests.db"
+MANIFEST_RETENTION = 30 * 24 * 3600  # seconds a manifest is kept after its last update
+
+
+def chunk_hashes(chunks: List[Chunk]) -> List[str]:
+    return [hashlib.sha256(chunk.content.encode("utf-8")).hexdigest()[:32] for chunk in chunks]
+
+
+def settings_hash(role: str, llm_params: LLMParams, run_params: RunParams) -> str:
+    """Hash the settings besides chunk content that are part of every summary's cache key,
+    so a change of any of them counts every chunk as changed."""
+    payload = json.dumps(
+        [
+            role,
+            run_params.shared_context,
+            run_params.file_context_tokens,
+            llm_params.model.name,
+            llm_params.temperature,
+            llm_params.max_tokens,
+        ],
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+class ManifestStore:
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        """The chunk hashes and settings of the last summarized version of each document,
+        by owner and filename. The owner keeps users of a shared server apart, e.g. the id
+        a browser keeps in its config cookie, or the working directory of the CLI. Comparing
+        a new upload against it tells which chunks changed; the unchanged ones are served
+        from the summary cache. Safe to share between threads."""
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # Manifests keyed by filename alone were shared by every user
+            self._conn.execute("DROP TABLE IF EXISTS manifests")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS document_manifests ("
+                "owner TEXT NOT NULL, "
+                "document TEXT NOT NULL, "
+                "settings TEXT NOT NULL, "
+                "hashes TEXT NOT NULL, "
+                "updated REAL NOT NULL, "
+                "PRIMARY KEY (owner, document))"
+            )
+
+    def get(self, owner: str, document: str) -> Optional[Tuple[str, List[str]]]:
+        """Return the settings hash and chunk hashes of the last summarized version."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT settings, hashes FROM document_manifests "
+                "WHERE owner = ? AND document = ?",
+                (owner, document),
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def put(self, owner: str, document: str, settings: str, hashes: List[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO document_manifests VALUES (?, ?, ?, ?, ?)",
+                (owner, document, settings, json.dumps(hashes), time.time()),
+            )
+
+    def changed(
+        self, owner: str, document: str, chunks: List[Chunk], settings: str
+    ) -> Optional[List[int]]:
+        """Return the positions in `chunks` whose content is not in the last summarized
+        version of `document`, or None if it was never summarized. Chunks that only moved
+        count as unchanged, since their summaries are cached by content. All chunks count
+        as changed if `settings` differ from the last summary's."""
+        previous = self.get(owner, document)
+        if previous is None:
+            return None
+        previous_settings, previous_hashes = previous
+        if previous_settings != settings:
+            return list(range(len(chunks)))
+        known = set(previous_hashes)
+        return [i for i, digest in enumerate(chunk_hashes(chunks)) if digest not in known]
+
+    def prune(self, max_age: float = MANIFEST_RETENTION) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM document_manifests WHERE updated < ?", (time.time() - max_age,)
+            )
+
+    def close(self) -> None:
+        self._conn.close()
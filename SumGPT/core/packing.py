@@ -0,0 +1,75 @@
+import re
+from typing import Dict, List
+
+from datamodel.chunk import Chunk
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+
+DOCUMENT_OVERHEAD_TOKENS = 16  # delimiter tokens added around each packed document
+
+PACK_INSTRUCTIONS = (
+    "Below are {count} separate documents. Summarize each document on its own, following "
+    "your instructions, without mixing content between documents. Write the summary of "
+    "document N between a line `<<<SUMMARY N>>>` and a line `<<<END SUMMARY N>>>`, in "
+    "order, with nothing outside these blocks."
+)
+
+_SUMMARY = re.compile(r"<<<SUMMARY (\d+)>>>[ \t]*\n?(.*?)<<<END SUMMARY \1>>>", re.DOTALL)
+
+
+def enabled(run_params: RunParams) -> bool:
+    """Packed documents share one system prompt, so packing is off when every file has its
+    own file context in it."""
+    return bool(run_params.pack_tokens) and not run_params.file_context_tokens
+
+
+def max_documents(llm_params: LLMParams) -> int:
+    """Every packed document keeps the output limit of a request of its own, so a pack holds
+    as many documents as fit in the model's maximum output."""
+    return max(1, llm_params.model.max_output_tokens // max(1, llm_params.max_tokens))
+
+
+def pack(
+    chunks: List[Chunk], indices: List[int], limit: int, max_size: int
+) -> List[List[int]]:
+    """Group the `indices` of single-chunk documents into packs of at most `limit` tokens
+    and `max_size` documents, in order. Only packs of two or more are returned."""
+    counts: Dict[int, int] = {}
+    for chunk in chunks:
+        counts[chunk.input_id] = counts.get(chunk.input_id, 0) + 1
+
+    packs: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index in indices:
+        chunk = chunks[index]
+        tokens = chunk.tokens + DOCUMENT_OVERHEAD_TOKENS
+        if counts[chunk.input_id] > 1 or tokens > limit:
+            continue
+        if current and (current_tokens + tokens > limit or len(current) >= max_size):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return [p for p in packs if len(p) > 1]
+
+
+def build_prompt(contents: List[str]) -> str:
+    parts = [PACK_INSTRUCTIONS.format(count=len(contents))]
+    for number, content in enumerate(contents, 1):
+        parts.append(f"<<<DOCUMENT {number}>>>\n{content}\n<<<END DOCUMENT {number}>>>")
+    return "\n\n".join(parts)
+
+
+def parse_response(text: str, count: int) -> Dict[int, str]:
+    """Return the summaries found in a packed response by document position (0-based).
+    Documents whose block is missing, e.g. because the output was cut off, are left out."""
+    summaries: Dict[int, str] = {}
+    for match in _SUMMARY.finditer(text):
+        position = int(match.group(1)) - 1
+        content = match.group(2).strip()
+        if 0 <= position < count and content and position not in summaries:
+            summaries[position] = content
+    return summaries
@@ -0,0 +1,771 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from core import packing
+from core.batch import BATCH_DISCOUNT, BatchJob
+from core.cache import CachedSummary, SummaryCache
+from core.chunker import Chunker
+from core.dedupe import Deduplicator
+from core.journal import JournalEntry, RunJournal
+from core.llm import LLM
+from core.manifest import ManifestStore, chunk_hashes, settings_hash
+from core.planner import MESSAGE_OVERHEAD_TOKENS, Budget, BudgetExceeded
+from core.reducer import Reducer
+from core.scheduler import HedgePolicy, RequestScheduler
+from core.telemetry import RequestRecord, Telemetry
+from core.tokenizer import Tokenizer
+from datamodel.chunk import Chunk
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+from datamodel.summary import Summary
+from langchain_core.messages import BaseMessage
+
+ALL_FILES = "All files"  # filename of the cross-file summary in map-reduce mode
+PREFIX_CACHE_MIN_TOKENS = 1024  # OpenAI only caches prompt prefixes of at least this length
+
+DEFAULT_ROLE = (
+    "Write a detailed summary in perfect $(LANGUAGE) that is concise, clear and coherent while capturing the main ideas the text. "
+    "The summary should be well-structured and free of grammatical errors.\n\n"
+    "The summary is to be written in markdown format, with a heading (###) that encapsulate the core concept of the content. It should be concise and specific. avoid generic headings like 'Summary' or 'Introduction'."
+)
+
+
+def chunks_from_spans(text: str, spans, input_id: int) -> List[Chunk]:
+    """Chunks of `text` at its (start, end, tokens) character spans."""
+    return [
+        Chunk(count, text, tokens, input_id, start, end)
+        for count, (start, end, tokens) in enumerate(spans)
+    ]
+
+
+def segment_text(
+    text: str, chunk_size: int, model: str, input_id: int, mode: str = "tokens", overlap: int = 0
+) -> Tuple[List[Chunk], int]:
+    spans, total_tokens = Chunker(model, chunk_size, mode, overlap).split(text)
+    return chunks_from_spans(text, spans, input_id), total_tokens
+
+
+def segment_files(
+    texts: List[str],
+    chunk_size: int,
+    model: str,
+    mode: str = "tokens",
+    overlap: int = 0,
+    max_workers: Optional[int] = None,
+    segment: Callable[..., Tuple[List[Chunk], int]] = segment_text,
+    initializer: Optional[Callable[[], Any]] = None,
+) -> List[Tuple[List[Chunk], int, float]]:
+    """Segment every text on a thread pool; tiktoken releases the GIL while encoding.
+    Returns (chunks, total_tokens, seconds) per text, in the order of `texts`, with the
+    index of each text as the `input_id` of its chunks. `segment` takes the arguments of
+    `segment_text` in its place, e.g. to add a cache, and `initializer` runs in every
+    worker thread."""
+
+    def segment_one(input_id: int) -> Tuple[List[Chunk], int, float]:
+        start = time.perf_counter()
+        chunks, total_tokens = segment(texts[input_id], chunk_size, model, input_id, mode, overlap)
+        return chunks, total_tokens, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers, initializer=initializer) as pool:
+        return list(pool.map(segment_one, range(len(texts))))
+
+
+def system_prompt(role: str, shared_context: str = "", file_context: str = "") -> str:
+    """Lay out everything that is the same for many requests as one system message, so
+    their prompts share the longest possible prefix for the provider's prompt cache."""
+    parts = [role]
+    if shared_context:
+        parts.append(f"Shared context (for reference, do not summarize):\n\n{shared_context}")
+    if file_context:
+        parts.append(f"Beginning of the document (for reference):\n\n{file_context}")
+    return "\n\n".join(parts)
+
+
+def sort_chunks(chunks: List[Chunk]) -> List[Chunk]:
+    """Sort chunks by file, then by position in the file."""
+    return sorted(chunks, key=lambda c: (c.input_id, c.id))
+
+
+class Pipeline:
+    def __init__(
+        self,
+        api_key: str,
+        llm_params: LLMParams,
+        run_params: RunParams,
+        role: str,
+        scheduler: Optional[RequestScheduler] = None,
+    ):
+        """Generate summaries for chunks without any UI. `role` must already have
+        `$(LANGUAGE)` substituted. Pass a `scheduler` to share its concurrency and rate
+        budget with other pipelines."""
+        self.llm_params = llm_params
+        self.run_params = run_params
+        self.role = role
+        self.llm = LLM(api_key, llm_params)
+        if scheduler is None:
+            scheduler = RequestScheduler(run_params.max_concurrency, llm_params.model.limits)
+        self.scheduler = scheduler
+        self.tokenizer = Tokenizer(llm_params.model.name)
+        self.role_tokens = len(self.tokenizer.tokenize(role))
+        self.systems: Dict[int, str] = {}  # system prompt by input_id
+        self.system_tokens: Dict[int, int] = {}
+        self.reducer: Optional[Reducer] = None
+        self.reduce_errors: Dict[str, str] = {}  # merge error by filename
+        self.budget = Budget(run_params.max_price, run_params.max_tokens)
+        self.hedging: Optional[HedgePolicy] = None
+        if run_params.hedge_percentile:
+            self.hedging = HedgePolicy(run_params.hedge_percentile, run_params.hedge_budget)
+        self.telemetry = Telemetry(llm_params.model.name)
+
+        self.run_id: Optional[str] = None
+        self.total_price = 0.0
+        self.cache_hits = 0
+        self.saved_price = 0.0
+        self.resumed = 0
+        self.resumed_price = 0.0  # paid by earlier attempts, not part of total_price
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.warmed = 0
+        self.packed_requests = 0
+        self.packed_documents = 0
+        self.unpacked = 0  # packed documents that fell back to a request of their own
+        self.duplicates = 0  # chunks that reused the summary of a (near-)identical chunk
+        self.dedupe_saved_tokens = 0
+        self.dedupe_saved_price = 0.0
+
+    async def summarize(
+        self,
+        chunks: List[Chunk],
+        on_summary: Optional[Callable[[int, Summary], None]] = None,
+        on_partial: Optional[Callable[[int, str], None]] = None,
+    ) -> List[Summary]:
+        """Summarize every chunk and return the summaries in the order of `chunks`.
+
+        `on_summary(index, summary)` is called as soon as each summary is ready, resumed and
+        cached ones first. When streaming is enabled, `on_partial(index, text)` receives the
+        text generated so far. A failed request does not stop the run; its summary comes
+        back with `error` set and is retried by the next run with the same chunks.
+
+        With `prefix_cache` enabled, one request per distinct system prompt is sent first
+        to warm the provider's prompt cache before the rest fan out.
+
+        With `hedge_percentile` set, requests slower than that percentile of recent ones are
+        raced against a duplicate, within the extra cost allowed by `hedge_budget`.
+
+        With `dedupe_threshold` set, only the first of each group of identical or
+        near-identical chunks is summarized, and its summary is given to the rest.
+
+        With `pack_tokens` set, files that fit in a single chunk are packed several to a
+        request. Documents missing from a packed response are summarized on their own."""
+        self._prepare_systems(chunks)
+        results: List[Optional[Summary]] = [None] * len(chunks)
+        cache = SummaryCache() if self.run_params.use_cache else None
+        cache_keys = [self._cache_key(chunk) for chunk in chunks]
+        journal = RunJournal() if self.run_params.resume else None
+        self.run_id = RunJournal.make_run_id(cache_keys)
+
+        pending = list(range(len(chunks)))
+        if journal is not None:
+            pending = self._serve_journal(
+                chunks, results, journal.completed(self.run_id), cache_keys, on_summary
+            )
+        pending = self._serve_cached(chunks, results, cache, cache_keys, on_summary, pending)
+        duplicates = self._find_duplicates(chunks)
+        pending = [index for index in pending if index not in duplicates]
+
+        streamed: Dict[int, int] = {}  # length of the partial text shown per chunk
+
+        async def request(index: int, chunk: Chunk, record: RequestRecord) -> BaseMessage:
+            system = self.systems[chunk.input_id]
+            if not (self.run_params.stream and on_partial):
+                return await self.llm.agenerate(chunk.content, system)
+
+            message = None
+            async for part in self.llm.astream(chunk.content, system):
+                record.first_token()
+                message = part if message is None else message + part
+                # A hedged chunk streams twice; only show whichever attempt is furthest along
+                text = str(message.content)
+                if len(text) >= streamed.get(index, 0):
+                    streamed[index] = len(text)
+                    on_partial(index, text)
+            return message
+
+        async def generate(index: int, chunk: Chunk):
+            input_tokens = chunk.tokens + self.system_tokens[chunk.input_id]
+            record = self.telemetry.record("chunk", chunk.filename, chunk.id)
+            try:
+                # Reserve the worst-case token usage against the model's rate limits, and
+                # its worst-case cost against the budget once it is about to be sent
+                message = await self.scheduler.run(
+                    lambda: self.budget.run(
+                        self.llm, lambda: request(index, chunk, record), input_tokens, record=record
+                    ),
+                    input_tokens + self.llm_params.max_tokens,
+                    self.run_params.request_timeout,
+                    self.hedging,
+                    record,
+                    self.budget.check,
+                )
+            except Exception as e:
+                record.fail(e)
+                return index, e
+            self._measure(record, message)
+            return index, message
+
+        async def drain(indices: List[int]) -> None:
+            tasks = [asyncio.ensure_future(generate(index, chunks[index])) for index in indices]
+            try:
+                for next_completed in asyncio.as_completed(tasks):
+                    index, message = await next_completed
+                    if isinstance(message, Exception):
+                        summary = Summary(chunks[index], "", 0, 0)
+                        summary.error = f"{type(message).__name__}: {message}"
+                        self.failed += 1
+                        results[index] = summary
+                        if on_summary:
+                            on_summary(index, summary)
+                    else:
+                        completion_tokens, prompt_tokens, cached_tokens = (
+                            self.llm.get_tokens(message)
+                        )
+                        self._record(
+                            index,
+                            chunks[index],
+                            str(message.content),
+                            (prompt_tokens, completion_tokens, cached_tokens),
+                            results,
+                            cache,
+                            cache_keys,
+                            on_summary,
+                        )
+                    if journal is not None:
+                        journal.record(self.run_id, cache_keys[index], results[index])
+            finally:
+                # Stop requests still in flight when the run is cancelled
+                for task in tasks:
+                    task.cancel()
+
+        async def generate_packed(group: List[int]):
+            system = self.systems[chunks[group[0]].input_id]
+            prompt = packing.build_prompt([chunks[index].content for index in group])
+            input_tokens = self.system_tokens[chunks[group[0]].input_id] + sum(
+                chunks[index].tokens + packing.DOCUMENT_OVERHEAD_TOKENS for index in group
+            )
+            max_tokens = min(
+                self.llm_params.model.max_output_tokens, self.llm_params.max_tokens * len(group)
+            )
+            record = self.telemetry.record("packed")
+            try:
+                message = await self.scheduler.run(
+                    lambda: self.budget.run(
+                        self.llm,
+                        lambda: self.llm.agenerate(prompt, system, max_tokens),
+                        input_tokens,
+                        max_tokens,
+                        record,
+                    ),
+                    input_tokens + max_tokens,
+                    # Packed requests are longer than the rest, so they are never hedged
+                    self.run_params.request_timeout,
+                    record=record,
+                    check=self.budget.check,
+                )
+            except Exception as e:
+                record.fail(e)
+                return group, e
+            self._measure(record, message)
+            return group, message
+
+        async def drain_packed(groups: List[List[int]]) -> List[int]:
+            """Run the packed requests and return the indices that must be sent alone."""
+            fallback: List[int] = []
+            tasks = [asyncio.ensure_future(generate_packed(group)) for group in groups]
+            try:
+                for next_completed in asyncio.as_completed(tasks):
+                    group, message = await next_completed
+                    if isinstance(message, Exception):
+                        # Smaller requests may still go through, e.g. within the budget
+                        fallback.extend(group)
+                        continue
+                    self.packed_requests += 1
+                    fallback.extend(
+                        self._record_packed(
+                            chunks, group, message, results, cache, cache_keys, on_summary
+                        )
+                    )
+                    if journal is not None:
+                        for index in group:
+                            if results[index] is not None:
+                                journal.record(self.run_id, cache_keys[index], results[index])
+            finally:
+                for task in tasks:
+                    task.cancel()
+            self.unpacked += len(fallback)
+            return fallback
+
+        try:
+            groups = []
+            if packing.enabled(self.run_params):
+                groups = packing.pack(
+                    chunks,
+                    pending,
+                    self.run_params.pack_tokens,
+                    packing.max_documents(self.llm_params),
+                )
+            packed = {index for group in groups for index in group}
+            single = [index for index in pending if index not in packed]
+
+            warm = self._warm_up_indices(chunks, single) if self.run_params.prefix_cache else []
+            if warm:
+                await drain(warm)
+                self.warmed = len(warm)
+            warmed = set(warm)
+            single = [index for index in single if index not in warmed]
+            if groups:
+                _, fallback = await asyncio.gather(drain(single), drain_packed(groups))
+                await drain(sorted(fallback))
+            else:
+                await drain(single)
+            # Requests cancelled in flight were billed without a summary to count them with
+            self.total_price += self.budget.take_abandoned()
+            self._fan_out(chunks, results, duplicates, on_summary)
+            if cache is not None:
+                self._update_manifests(chunks, results)
+            if journal is not None:
+                # A run without failures has nothing left to resume
+                if all(summary is not None and not summary.error for summary in results):
+                    journal.forget(self.run_id)
+                journal.prune()
+        finally:
+            if cache is not None:
+                cache.close()
+            if journal is not None:
+                journal.close()
+
+        return results
+
+    async def summarize_batch(
+        self,
+        chunks: List[Chunk],
+        job: BatchJob,
+        batch_id: Optional[str] = None,
+        on_submitted: Optional[Callable[[str], None]] = None,
+        on_status: Optional[Callable[[str, int, int], None]] = None,
+        on_summary: Optional[Callable[[int, Summary], None]] = None,
+    ) -> List[Summary]:
+        """Summarize chunks through the Batch API at half price. Cache hits are served
+        first and only the remaining chunks are submitted; pass `batch_id` to resume polling
+        a batch submitted earlier instead. Failed requests get a summary with `error` set."""
+        self._prepare_systems(chunks)
+        results: List[Optional[Summary]] = [None] * len(chunks)
+        cache = SummaryCache() if self.run_params.use_cache else None
+        cache_keys = [self._cache_key(chunk) for chunk in chunks]
+        try:
+            # Chunks of a resumed batch are exactly those that missed the cache on submission
+            pending = self._serve_cached(chunks, results, cache, cache_keys, on_summary)
+            duplicates = self._find_duplicates(chunks)
+            pending = [index for index in pending if index not in duplicates]
+            if not pending:
+                self._fan_out(chunks, results, duplicates, on_summary)
+                return results
+            if batch_id is None:
+                batch_chunks = [chunks[i] for i in pending]
+                self._reserve_batch(batch_chunks)
+                systems = [self.systems[chunk.input_id] for chunk in batch_chunks]
+                batch_id = await job.submit(batch_chunks, systems)
+            if on_submitted:
+                on_submitted(batch_id)
+
+            batch = await job.wait(batch_id, on_status)
+            batch_results = await job.results(batch)
+            for index in pending:
+                chunk = chunks[index]
+                result = batch_results.get(BatchJob.custom_id(chunk))
+                if result is None or result.error:
+                    summary = Summary(chunk, "", 0, 0)
+                    summary.error = result.error if result else f"batch {batch.status}"
+                    results[index] = summary
+                    if on_summary:
+                        on_summary(index, summary)
+                    continue
+                usage = (result.prompt_tokens, result.completion_tokens, result.cached_tokens)
+                self._record(
+                    index,
+                    chunk,
+                    result.content,
+                    usage,
+                    results,
+                    cache,
+                    cache_keys,
+                    on_summary,
+                    BATCH_DISCOUNT,
+                )
+            self._fan_out(chunks, results, duplicates, on_summary, BATCH_DISCOUNT)
+            if cache is not None:
+                self._update_manifests(chunks, results)
+        finally:
+            if cache is not None:
+                cache.close()
+
+        return results
+
+    def _reserve_batch(self, chunks: List[Chunk]) -> None:
+        # A batch cannot be stopped part way, so its whole worst case must fit the budget
+        price = 0.0
+        tokens = 0
+        for chunk in chunks:
+            prompt_tokens = (
+                chunk.tokens + self.system_tokens[chunk.input_id] + MESSAGE_OVERHEAD_TOKENS
+            )
+            price += self.llm.Calc_price(prompt_tokens, self.llm_params.max_tokens)
+            tokens += prompt_tokens + self.llm_params.max_tokens
+        self.budget.reserve(price * BATCH_DISCOUNT, tokens)
+
+    def _prepare_systems(self, chunks: List[Chunk]) -> None:
+        """Build the system prompt of each file: the role, the shared context and, when
+        `file_context_tokens` is set, the beginning of the file."""
+        first_chunks: Dict[int, Chunk] = {}
+        for chunk in chunks:
+            first = first_chunks.get(chunk.input_id)
+            if first is None or chunk.id < first.id:
+                first_chunks[chunk.input_id] = chunk
+
+        context_tokens = self.run_params.file_context_tokens
+        for input_id, chunk in first_chunks.items():
+            file_context = ""
+            if context_tokens:
+                tokens = self.tokenizer.tokenize(chunk.content)[:context_tokens]
+                file_context = self.tokenizer.detokenize(tokens)
+            system = system_prompt(self.role, self.run_params.shared_context, file_context)
+            self.systems[input_id] = system
+            self.system_tokens[input_id] = len(self.tokenizer.tokenize(system))
+
+    def _update_manifests(self, chunks: List[Chunk], results: List[Optional[Summary]]) -> None:
+        """Record the chunks of every file summarized without errors as its last version."""
+        by_filename: Dict[str, List[Chunk]] = {}
+        failed = set()
+        for chunk, summary in zip(chunks, results):
+            if chunk.filename is None:
+                continue
+            by_filename.setdefault(chunk.filename, []).append(chunk)
+            if summary is None or summary.error:
+                failed.add(chunk.filename)
+
+        settings = settings_hash(self.role, self.llm_params, self.run_params)
+        manifests = ManifestStore()
+        try:
+            for filename, file_chunks in by_filename.items():
+                if filename not in failed:
+                    manifests.put(
+                        self.run_params.manifest_owner,
+                        filename,
+                        settings,
+                        chunk_hashes(sort_chunks(file_chunks)),
+                    )
+            manifests.prune()
+        finally:
+            manifests.close()
+
+    def _find_duplicates(self, chunks: List[Chunk]) -> Dict[int, int]:
+        """Map each duplicate chunk to the chunk summarized in its place."""
+        if not self.run_params.dedupe_threshold:
+            return {}
+        deduplicator = Deduplicator(self.run_params.dedupe_threshold)
+        return deduplicator.duplicates([chunk.content for chunk in chunks])
+
+    def _fan_out(
+        self,
+        chunks: List[Chunk],
+        results: List[Optional[Summary]],
+        duplicates: Dict[int, int],
+        on_summary: Optional[Callable[[int, Summary], None]],
+        price_factor: float = 1.0,
+    ) -> None:
+        """Give every duplicate without a summary of its own that of its representative,
+        and count the request it avoided."""
+        for index, representative in duplicates.items():
+            source = results[representative]
+            if results[index] is not None or source is None:
+                continue
+            chunk = chunks[index]
+            summary = Summary(chunk, source.content, 0, 0)
+            summary.duplicate_of = source.chunk
+            if source.error:
+                summary.error = source.error
+                self.failed += 1
+            else:
+                prompt_tokens = (
+                    chunk.tokens + self.system_tokens[chunk.input_id] + MESSAGE_OVERHEAD_TOKENS
+                )
+                completion_tokens = source.completion_tokens
+                summary.saved_price = round(
+                    self.llm.Calc_price(prompt_tokens, completion_tokens) * price_factor, 6
+                )
+                self.duplicates += 1
+                self.dedupe_saved_tokens += prompt_tokens + completion_tokens
+                self.dedupe_saved_price += summary.saved_price
+            results[index] = summary
+            if on_summary:
+                on_summary(index, summary)
+
+    def _warm_up_indices(self, chunks: List[Chunk], pending: List[int]) -> List[int]:
+        """Pick the first pending chunk of every system prompt long enough to be cached."""
+        warm: Dict[str, int] = {}
+        for index in pending:
+            input_id = chunks[index].input_id
+            if self.system_tokens[input_id] < PREFIX_CACHE_MIN_TOKENS:
+                continue
+            warm.setdefault(self.systems[input_id], index)
+        return list(warm.values())
+
+    def _serve_cached(
+        self,
+        chunks: List[Chunk],
+        results: List[Optional[Summary]],
+        cache: Optional[SummaryCache],
+        cache_keys: List[str],
+        on_summary: Optional[Callable[[int, Summary], None]],
+        indices: Optional[List[int]] = None,
+    ) -> List[int]:
+        """Fill `results` with cache hits and return the indices still to generate."""
+        pending = []
+        for index in range(len(chunks)) if indices is None else indices:
+            chunk = chunks[index]
+            hit = cache.get(cache_keys[index]) if cache is not None else None
+            if hit is None:
+                pending.append(index)
+                continue
+            summary = Summary(
+                chunk, hit.content, hit.prompt_tokens, hit.completion_tokens, hit.cached_tokens
+            )
+            summary.from_cache = True
+            summary.saved_price = round(
+                self.llm.Calc_price(hit.prompt_tokens, hit.completion_tokens, hit.cached_tokens), 6
+            )
+            self.cache_hits += 1
+            self.saved_price += summary.saved_price
+            results[index] = summary
+            if on_summary:
+                on_summary(index, summary)
+        return pending
+
+    def _serve_journal(
+        self,
+        chunks: List[Chunk],
+        results: List[Optional[Summary]],
+        completed: Dict[str, JournalEntry],
+        cache_keys: List[str],
+        on_summary: Optional[Callable[[int, Summary], None]],
+    ) -> List[int]:
+        """Fill `results` with chunks an earlier attempt of this run already completed and
+        return the indices still to generate. They cost nothing in this attempt."""
+        pending = []
+        for index, chunk in enumerate(chunks):
+            entry = completed.get(cache_keys[index])
+            if entry is None:
+                pending.append(index)
+                continue
+            summary = Summary(
+                chunk,
+                entry.content,
+                entry.prompt_tokens,
+                entry.completion_tokens,
+                entry.cached_tokens,
+            )
+            summary.resumed = True
+            summary.saved_price = entry.price
+            self.resumed += 1
+            self.resumed_price += entry.price
+            results[index] = summary
+            if on_summary:
+                on_summary(index, summary)
+        return pending
+
+    def _record(
+        self,
+        index: int,
+        chunk: Chunk,
+        content: str,
+        usage: Tuple[int, int, int],
+        results: List[Optional[Summary]],
+        cache: Optional[SummaryCache],
+        cache_keys: List[str],
+        on_summary: Optional[Callable[[int, Summary], None]],
+        price_factor: float = 1.0,
+    ) -> None:
+        prompt_tokens, completion_tokens, cached_tokens = usage
+        price = round(
+            self.llm.Calc_price(prompt_tokens, completion_tokens, cached_tokens) * price_factor, 6
+        )
+        summary = Summary(chunk, content, prompt_tokens, completion_tokens, cached_tokens, price)
+        self.total_price += price
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        results[index] = summary
+        if on_summary:
+            on_summary(index, summary)
+        if cache is not None:
+            cache.put(
+                cache_keys[index],
+                CachedSummary(content, prompt_tokens, completion_tokens, cached_tokens),
+            )
+
+    def _measure(self, record: RequestRecord, message: BaseMessage) -> None:
+        completion_tokens, prompt_tokens, cached_tokens = self.llm.get_tokens(message)
+        record.succeed(
+            (prompt_tokens, completion_tokens, cached_tokens),
+            self.llm.Calc_price(prompt_tokens, completion_tokens, cached_tokens),
+        )
+
+    def _record_packed(
+        self,
+        chunks: List[Chunk],
+        group: List[int],
+        message: BaseMessage,
+        results: List[Optional[Summary]],
+        cache: Optional[SummaryCache],
+        cache_keys: List[str],
+        on_summary: Optional[Callable[[int, Summary], None]],
+    ) -> List[int]:
+        """Split a packed response back into one summary per document and return the
+        indices of documents it has no summary for.
+
+        Prompt tokens are attributed in proportion to each document's tokens and completion
+        tokens in proportion to the length of its summary. The share of documents without
+        a summary is still paid for, so it is added to the totals directly."""
+        parsed = packing.parse_response(str(message.content), len(group))
+        completion_tokens, prompt_tokens, cached_tokens = self.llm.get_tokens(message)
+        document_tokens = sum(chunks[index].tokens for index in group) or 1
+        summary_length = sum(len(content) for content in parsed.values()) or 1
+
+        missing = []
+        recorded = (0, 0, 0)
+        for position, index in enumerate(group):
+            content = parsed.get(position)
+            if content is None:
+                missing.append(index)
+                continue
+            share = chunks[index].tokens / document_tokens
+            usage = (
+                int(prompt_tokens * share),
+                int(completion_tokens * len(content) / summary_length),
+                int(cached_tokens * share),
+            )
+            recorded = tuple(a + b for a, b in zip(recorded, usage))
+            self._record(
+                index, chunks[index], content, usage, results, cache, cache_keys, on_summary
+            )
+            self.packed_documents += 1
+
+        unrecorded = (
+            prompt_tokens - recorded[0],
+            completion_tokens - recorded[1],
+            cached_tokens - recorded[2],
+        )
+        self.total_price += self.llm.Calc_price(*unrecorded)
+        self.prompt_tokens += unrecorded[0]
+        self.cached_tokens += unrecorded[2]
+        return missing
+
+    async def reduce(
+        self,
+        summaries: List[Summary],
+        on_reduced: Optional[Callable[[str, str], None]] = None,
+    ) -> Dict[str, str]:
+        """Merge the summaries of each file into one (map-reduce mode), and optionally all
+        files into a single summary under `ALL_FILES`. Returns summaries by filename.
+
+        A file whose merge fails is left out of the result and its error is kept in
+        `reduce_errors`; the other files are still merged."""
+        self.reducer = Reducer(
+            self.llm,
+            self.scheduler,
+            self.role,
+            self.run_params.reduce_prompt,
+            self.budget,
+            self.run_params.request_timeout,
+            self.telemetry,
+            self.run_params.recursive_prompt,
+        )
+
+        by_filename: Dict[str, List[str]] = {}
+        for summary in summaries:
+            if not summary.error:
+                by_filename.setdefault(summary.chunk.filename, []).append(summary.content)
+
+        async def reduce_file(filename: str, contents: List[str]):
+            try:
+                return filename, await self.reducer.reduce(contents)
+            except BudgetExceeded:
+                return filename, None
+            except Exception as e:
+                self.reduce_errors[filename] = f"{type(e).__name__}: {e}"
+                return filename, None
+
+        reduced = {}
+        tasks = [reduce_file(filename, contents) for filename, contents in by_filename.items()]
+        for next_completed in asyncio.as_completed(tasks):
+            filename, content = await next_completed
+            if content is None:
+                continue
+            reduced[filename] = content
+            if on_reduced:
+                on_reduced(filename, content)
+
+        # Keep file order for the results and the cross-file merge
+        reduced = {filename: reduced[filename] for filename in by_filename if filename in reduced}
+        if self.run_params.cross_file and len(reduced) > 1:
+            _, content = await reduce_file(ALL_FILES, list(reduced.values()))
+            if content is not None:
+                reduced[ALL_FILES] = content
+                if on_reduced:
+                    on_reduced(ALL_FILES, content)
+
+        self.total_price += self.reducer.price + self.budget.take_abandoned()
+        return reduced
+
+    def _cache_key(self, chunk: Chunk) -> str:
+        return SummaryCache.make_key(
+            chunk.content,
+            self.systems[chunk.input_id],
+            self.llm_params.model.name,
+            self.llm_params.temperature,
+            self.llm_params.max_tokens,
+        )
+
+
+def serialize_markdown(summaries: List[dict], reduced: Optional[List[dict]] = None) -> str:
+    markdown = ""
+    reduced_by_filename = {r["filename"]: r["content"] for r in reduced or []}
+    if ALL_FILES in reduced_by_filename:
+        markdown += f"# {ALL_FILES}\n"
+        markdown += reduced_by_filename[ALL_FILES]
+        markdown += "\n\n"
+
+    markdown_by_filename = {}
+    for summary in summaries:
+        filename = summary["filename"]
+        if filename not in markdown_by_filename:
+            markdown_by_filename[filename] = []
+        markdown_by_filename[filename].append(summary["content"])
+
+    for filename, content in markdown_by_filename.items():
+        markdown += f"# {filename}\n"
+        if filename in reduced_by_filename:
+            markdown += reduced_by_filename[filename]
+            markdown += "\n\n"
+        markdown += "\n\n".join(content)
+        markdown += "\n\n"
+
+    return markdown
+
+
+def serialize_jsonl(summaries: List[dict], reduced: Optional[List[dict]] = None) -> str:
+    lines = [json.dumps({"type": "chunk", **summary}, ensure_ascii=False) for summary in summaries]
+    lines += [json.dumps({"type": "combined", **r}, ensure_ascii=False) for r in reduced or []]
+    return "\n".join(lines) + "\n" if lines else ""
@@ -0,0 +1,210 @@
+import asyncio
+import math
+from typing import Awaitable, Callable, List, Optional
+
+from core import packing
+from core.llm import LLM
+from core.telemetry import RequestRecord
+from datamodel.chunk import Chunk
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+from langchain_core.messages import BaseMessage
+
+# Heuristics for the expected (rather than worst) case
+EXPECTED_OUTPUT_RATIO = 0.6  # share of max_tokens a summary typically uses
+MESSAGE_OVERHEAD_TOKENS = 8  # chat formatting tokens added per request
+BASE_LATENCY = 0.8  # seconds to first token
+OUTPUT_TOKENS_PER_SECOND = 60.0
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class RunPlan:
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.max_completion_tokens = 0
+        self.expected_completion_tokens = 0
+        self.worst_cost = 0.0
+        self.expected_cost = 0.0
+        self.expected_seconds = 0.0
+
+    @property
+    def worst_tokens(self) -> int:
+        return self.prompt_tokens + self.max_completion_tokens
+
+
+class Planner:
+    def __init__(self, llm_params: LLMParams, run_params: RunParams, role_tokens: int):
+        """Estimate the cost and wall time of a run before it starts. `role_tokens` counts
+        the system prompt shared by all requests."""
+        self.llm_params = llm_params
+        self.run_params = run_params
+        self.role_tokens = role_tokens
+
+    def plan(self, chunks: List[Chunk]) -> RunPlan:
+        plan = RunPlan()
+        max_tokens = self.llm_params.max_tokens
+        expected_output = int(max_tokens * EXPECTED_OUTPUT_RATIO)
+        # Requests also repeat the beginning of their file when file context is enabled
+        context_tokens = self.run_params.file_context_tokens
+        packs = []
+        if packing.enabled(self.run_params):
+            packs = packing.pack(
+                chunks,
+                list(range(len(chunks))),
+                self.run_params.pack_tokens,
+                packing.max_documents(self.llm_params),
+            )
+        packed = set()
+        for group in packs:
+            packed.update(group)
+            input_tokens = sum(chunks[i].tokens for i in group)
+            input_tokens += packing.DOCUMENT_OVERHEAD_TOKENS * len(group)
+            self._add_request(
+                plan, input_tokens, max_tokens * len(group), expected_output * len(group)
+            )
+        for index, chunk in enumerate(chunks):
+            if index not in packed:
+                self._add_request(plan, chunk.tokens + context_tokens, max_tokens, expected_output)
+
+        if self.run_params.summary_mode == "map-reduce":
+            self._add_reduce(plan, chunks, expected_output)
+
+        pricing = self.llm_params.model.pricing
+        plan.worst_cost = pricing.calc_price(plan.prompt_tokens, plan.max_completion_tokens)
+        plan.expected_cost = pricing.calc_price(
+            plan.prompt_tokens, plan.expected_completion_tokens
+        )
+        plan.expected_seconds = self._estimate_seconds(plan, expected_output)
+        return plan
+
+    def _add_request(
+        self, plan: RunPlan, input_tokens: int, max_tokens: int, expected_output: int
+    ) -> None:
+        plan.requests += 1
+        plan.prompt_tokens += input_tokens + self.role_tokens + MESSAGE_OVERHEAD_TOKENS
+        plan.max_completion_tokens += max_tokens
+        plan.expected_completion_tokens += expected_output
+
+    def _add_reduce(self, plan: RunPlan, chunks: List[Chunk], summary_tokens: int) -> None:
+        # Each merge request packs as many summaries as fit in the context window
+        budget = self.llm_params.model.context_window - self.llm_params.max_tokens
+        group_size = max(2, budget // max(1, summary_tokens))
+        counts = {}
+        for chunk in chunks:
+            counts[chunk.input_id] = counts.get(chunk.input_id, 0) + 1
+        if self.run_params.cross_file and len(counts) > 1:
+            counts[-1] = len(counts)
+
+        for count in counts.values():
+            while count > 1:
+                merges = math.ceil(count / group_size)
+                for _ in range(merges):
+                    size = min(group_size, count)
+                    self._add_request(
+                        plan, size * summary_tokens, self.llm_params.max_tokens, summary_tokens
+                    )
+                count = merges
+
+    def _estimate_seconds(self, plan: RunPlan, expected_output: int) -> float:
+        latency = BASE_LATENCY + expected_output / OUTPUT_TOKENS_PER_SECOND
+        seconds = math.ceil(plan.requests / self.run_params.max_concurrency) * latency
+
+        # Rate limits put a floor under the wall time of large runs
+        limits = self.llm_params.model.limits
+        if limits.rpm:
+            seconds = max(seconds, (plan.requests - limits.rpm) / limits.rpm * 60)
+        if limits.tpm:
+            seconds = max(seconds, (plan.worst_tokens - limits.tpm) / limits.tpm * 60)
+        return seconds
+
+
+class Budget:
+    def __init__(self, max_price: float = 0, max_tokens: int = 0):
+        """Hard caps on the spend of a run; 0 disables a cap. Each request reserves its
+        worst case before it is sent and settles to its actual usage when it returns."""
+        self.max_price = max_price
+        self.max_tokens = max_tokens
+        self.spent_price = 0.0
+        self.spent_tokens = 0
+        self.reserved_price = 0.0
+        self.reserved_tokens = 0
+        self.exceeded = False
+        self.abandoned_price = 0.0  # of requests cancelled after they were sent
+        self.hedge_price = 0.0  # the part of it spent on hedged requests
+        self._untaken_price = 0.0
+
+    def check(self) -> None:
+        """Raise `BudgetExceeded` once the budget has been reached."""
+        if self.exceeded:
+            raise BudgetExceeded("budget reached, request skipped")
+
+    def reserve(self, price: float, tokens: int) -> None:
+        self.check()
+        if self.max_price and self.spent_price + self.reserved_price + price > self.max_price:
+            self.exceeded = True
+            raise BudgetExceeded(f"request would exceed the ${self.max_price} budget")
+        if self.max_tokens and self.spent_tokens + self.reserved_tokens + tokens > self.max_tokens:
+            self.exceeded = True
+            raise BudgetExceeded(f"request would exceed the {self.max_tokens} token budget")
+        self.reserved_price += price
+        self.reserved_tokens += tokens
+
+    def settle(self, reserved_price: float, reserved_tokens: int, price: float, tokens: int):
+        """Replace a reservation with the actual usage (0 if the request failed)."""
+        self.reserved_price -= reserved_price
+        self.reserved_tokens -= reserved_tokens
+        self.spent_price += price
+        self.spent_tokens += tokens
+
+    def take_abandoned(self) -> float:
+        """Return the price of requests abandoned since the last call, which has no
+        response to be counted with."""
+        price, self._untaken_price = self._untaken_price, 0.0
+        return price
+
+    async def run(
+        self,
+        llm: LLM,
+        request: Callable[[], Awaitable[BaseMessage]],
+        input_tokens: int,
+        max_tokens: Optional[int] = None,
+        record: Optional[RequestRecord] = None,
+    ) -> BaseMessage:
+        """Send `request` if its worst case fits the remaining budget, else raise
+        `BudgetExceeded`. `input_tokens` excludes the per-message overhead; `max_tokens`
+        defaults to the output limit of `llm.llm_params`. The price of an attempt that is
+        cancelled in flight is added to `record`."""
+        prompt_tokens = input_tokens + MESSAGE_OVERHEAD_TOKENS
+        if max_tokens is None:
+            max_tokens = llm.llm_params.max_tokens
+        price = llm.Calc_price(prompt_tokens, max_tokens)
+        self.reserve(price, prompt_tokens + max_tokens)
+        try:
+            message = await request()
+        except asyncio.CancelledError:
+            # A hedge that lost its race or a request that timed out was still sent, so
+            # it is billed for its prompt at least
+            charged = llm.Calc_price(prompt_tokens, 0)
+            self.settle(price, prompt_tokens + max_tokens, charged, prompt_tokens)
+            self.abandoned_price += charged
+            self._untaken_price += charged
+            if record is not None:
+                record.abandoned_price += charged
+                if record.hedged:
+                    self.hedge_price += charged
+            raise
+        except BaseException:
+            self.settle(price, prompt_tokens + max_tokens, 0, 0)
+            raise
+        completion_tokens, actual_prompt_tokens, cached_tokens = llm.get_tokens(message)
+        self.settle(
+            price,
+            prompt_tokens + max_tokens,
+            llm.Calc_price(actual_prompt_tokens, completion_tokens, cached_tokens),
+            actual_prompt_tokens + completion_tokens,
+        )
+        return message
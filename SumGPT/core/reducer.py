@@ -0,0 +1,151 @@
+import asyncio
+from typing import Dict, List, Optional
+
+from core.llm import LLM
+from core.planner import Budget
+from core.scheduler import RequestScheduler
+from core.telemetry import Telemetry
+from core.tokenizer import Tokenizer
+
+SEPARATOR = "\n\n---\n\n"
+# Pairs of summaries merge 65536 into one in 16 levels; needing more means merges stopped
+# getting shorter than what they merge
+MAX_LEVELS = 16
+
+
+class LevelStats:
+    def __init__(self, level: int):
+        self.level = level
+        self.requests = 0
+        self.tokens = 0
+        self.price = 0.0
+
+
+class Reducer:
+    def __init__(
+        self,
+        llm: LLM,
+        scheduler: RequestScheduler,
+        role: str,
+        prompt: str,
+        budget: Optional[Budget] = None,
+        timeout: float = 0,
+        telemetry: Optional[Telemetry] = None,
+        recursive_prompt: Optional[str] = None,
+    ):
+        """Recursively merge summaries into one, packing each merge request to fit the
+        model's context window. `prompt` is used for the last merge and `recursive_prompt`
+        (default `prompt`) for the levels before it; both must contain a `{text}`
+        placeholder. `timeout` is the deadline of each merge request in seconds (0 = none).
+        Merge requests are recorded in `telemetry` if given."""
+        self.llm = llm
+        self.scheduler = scheduler
+        self.role = role
+        self.prompt = prompt
+        self.recursive_prompt = recursive_prompt or prompt
+        self.tokenizer = Tokenizer(llm.llm_params.model.name)
+        self.levels: Dict[int, LevelStats] = {}
+        self.budget = budget if budget else Budget()
+        self.timeout = timeout
+        self.telemetry = telemetry
+
+        prompt_tokens = max(
+            len(self.tokenizer.tokenize(prompt)),
+            len(self.tokenizer.tokenize(self.recursive_prompt)),
+        )
+        self.overhead = len(self.tokenizer.tokenize(role)) + prompt_tokens
+        self.separator_tokens = len(self.tokenizer.tokenize(SEPARATOR))
+        self.window = (
+            llm.llm_params.model.context_window - llm.llm_params.max_tokens - self.overhead
+        )
+
+    @property
+    def price(self) -> float:
+        return sum(stats.price for stats in self.levels.values())
+
+    async def reduce(self, summaries: List[str]) -> str:
+        """Merge `summaries` level by level until a single summary remains. All merges of
+        a level run concurrently through the scheduler."""
+        level = 0
+        while len(summaries) > 1:
+            level += 1
+            if level > MAX_LEVELS:
+                raise ValueError(
+                    f"Summaries still do not fit one merge after {MAX_LEVELS} levels; "
+                    "lower the max tokens of the model"
+                )
+            groups = self._pack(summaries)
+            prompt = self.prompt if len(groups) == 1 else self.recursive_prompt
+            summaries = list(
+                await asyncio.gather(*[self._merge(g, level, prompt) for g in groups])
+            )
+        return summaries[0] if summaries else ""
+
+    def _pack(self, summaries: List[str]) -> List[List[str]]:
+        """Group consecutive summaries into merge requests that fit the context window."""
+        counts = [len(self.tokenizer.tokenize(s + SEPARATOR)) for s in summaries]
+        groups = self._group(summaries, counts)
+
+        # Summaries too large to share a request, or to fit one at all, are split into
+        # pieces of at most half the window, so that any two of them fit a request
+        if len(groups) == len(summaries) or max(counts) > self.window:
+            half = max(1, self.window // 2 - self.separator_tokens)
+            pieces: List[str] = []
+            piece_counts: List[int] = []
+            for summary, count in zip(summaries, counts):
+                if count <= half + self.separator_tokens:
+                    pieces.append(summary)
+                    piece_counts.append(count)
+                    continue
+                spans, _ = self.tokenizer.split_spans(summary, half)
+                for start, end, tokens in spans:
+                    pieces.append(summary[start:end])
+                    piece_counts.append(tokens + self.separator_tokens)
+            groups = self._group(pieces, piece_counts)
+        return groups
+
+    def _group(self, summaries: List[str], counts: List[int]) -> List[List[str]]:
+        groups: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for summary, count in zip(summaries, counts):
+            if current and current_tokens + count > self.window:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += count
+        if current:
+            groups.append(current)
+        return groups
+
+    async def _merge(self, group: List[str], level: int, prompt: str) -> str:
+        if len(group) == 1:
+            return group[0]
+        text = SEPARATOR.join(group)
+        prompt = prompt.replace("{text}", text)
+        tokens = len(self.tokenizer.tokenize(text)) + self.overhead
+        record = self.telemetry.record("reduce") if self.telemetry else None
+        try:
+            message = await self.scheduler.run(
+                lambda: self.budget.run(
+                    self.llm, lambda: self.llm.agenerate(prompt, self.role), tokens, record=record
+                ),
+                tokens + self.llm.llm_params.max_tokens,
+                self.timeout,
+                record=record,
+                check=self.budget.check,
+            )
+        except Exception as e:
+            if record is not None:
+                record.fail(e)
+            raise
+
+        completion_tokens, prompt_tokens, cached_tokens = self.llm.get_tokens(message)
+        price = self.llm.Calc_price(prompt_tokens, completion_tokens, cached_tokens)
+        stats = self.levels.setdefault(level, LevelStats(level))
+        stats.requests += 1
+        stats.tokens += completion_tokens + prompt_tokens
+        stats.price += price
+        if record is not None:
+            record.succeed((prompt_tokens, completion_tokens, cached_tokens), price)
+        return str(message.content)
@@ -0,0 +1,262 @@
+import asyncio
+import math
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Set, TypeVar
+
+from core.telemetry import RequestRecord
+from datamodel.llm_model import LLMModelLimits
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+LATENCY_WINDOW = 200  # recent request latencies kept per scheduler
+MIN_LATENCY_SAMPLES = 20  # latencies needed before requests are hedged
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, period: float = 60.0):
+        """Bucket holding `capacity` units that refills completely every `period` seconds."""
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill()
+        amount = min(amount, self.capacity)  # oversized requests only need a full bucket
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+class LatencyTracker:
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = MIN_LATENCY_SAMPLES):
+        """Latencies of the most recent successful requests."""
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Return the `percentile` (0-100) latency, or None until enough samples are in."""
+        if len(self._samples) < self.min_samples:
+            return None
+        samples = sorted(self._samples)
+        rank = math.ceil(percentile / 100 * len(samples)) - 1
+        return samples[min(len(samples) - 1, max(0, rank))]
+
+
+class HedgePolicy:
+    def __init__(self, percentile: float = 95.0, budget: float = 0.1):
+        """Send a duplicate of any request still running after the `percentile` latency
+        of its model, and keep whichever answers first. Duplicates may add at most `budget`
+        (a share of the worst-case tokens of all requests sent) to the cost of the run.
+        One policy per run; it also counts what hedging did."""
+        self.percentile = percentile
+        self.budget = budget
+        self.sent_tokens = 0
+        self.hedged_tokens = 0
+        self.hedges = 0
+        self.wins = 0  # hedges that answered before the original request
+
+    def allows(self, tokens: int) -> bool:
+        return self.hedged_tokens + tokens <= self.budget * self.sent_tokens
+
+
+class RequestScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        limits: Optional[LLMModelLimits] = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ):
+        """Bound in-flight requests and budget them against per-model RPM/TPM limits.
+        Pass a `semaphore` to share one concurrency limit between several schedulers."""
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.timeouts = 0
+        self.latencies = LatencyTracker()
+
+        self._semaphore = semaphore if semaphore else asyncio.Semaphore(max_concurrency)
+        self._lock = asyncio.Lock()
+        self._request_bucket = TokenBucket(limits.rpm) if limits and limits.rpm else None
+        self._token_bucket = TokenBucket(limits.tpm) if limits and limits.tpm else None
+
+    async def run(
+        self,
+        request: Callable[[], Awaitable[T]],
+        tokens: int = 0,
+        timeout: float = 0,
+        hedging: Optional[HedgePolicy] = None,
+        record: Optional[RequestRecord] = None,
+        check: Optional[Callable[[], None]] = None,
+    ) -> T:
+        """Run `request` once a concurrency slot and rate budget are available, retrying
+        rate-limit and server errors with jittered exponential backoff.
+
+        `tokens` is the worst-case token usage of the request (prompt + max output). Each
+        attempt is abandoned and retried after `timeout` seconds (0 = no deadline). With
+        `hedging`, a slow attempt is raced against a duplicate; only hedged calls feed the
+        latency statistics, so requests of a different size do not skew them. A `record`
+        receives the time spent queueing, waiting for rate budget and backing off, the
+        retries and the latency of the attempt that succeeded. `check` is called before
+        and between the waits for a slot and rate budget, and raises to give the request
+        up without waiting any further, e.g. once the run's budget is spent."""
+        attempt = 0
+        while True:
+            if check is not None:
+                check()
+            queued = time.monotonic()
+            async with self._semaphore:
+                reserving = time.monotonic()
+                await self._reserve(tokens, check)
+                if record is not None:
+                    record.queue_wait += reserving - queued
+                    record.rate_wait += time.monotonic() - reserving
+                    record.start_attempt()
+                try:
+                    if hedging is None:
+                        result = await self._attempt(request, timeout, record=record)
+                    else:
+                        result = await self._hedged(request, tokens, timeout, hedging, record)
+                    if record is not None:
+                        record.latency = time.monotonic() - record.started
+                    return result
+                except Exception as e:
+                    if attempt >= self.max_retries or not self._is_retryable(e):
+                        raise
+                    delay = self._backoff(attempt, e)
+            attempt += 1
+            self.retries += 1
+            if record is not None:
+                record.retries += 1
+                record.backoff += delay
+            await asyncio.sleep(delay)
+
+    async def _attempt(
+        self,
+        request: Callable[[], Awaitable[T]],
+        timeout: float,
+        track: bool = False,
+        record: Optional[RequestRecord] = None,
+    ) -> T:
+        start = time.monotonic()
+        try:
+            result = await (asyncio.wait_for(request(), timeout) if timeout else request())
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            if record is not None:
+                record.timeouts += 1
+            raise
+        if track:
+            self.latencies.add(time.monotonic() - start)
+        return result
+
+    async def _hedged(
+        self,
+        request: Callable[[], Awaitable[T]],
+        tokens: int,
+        timeout: float,
+        hedging: HedgePolicy,
+        record: Optional[RequestRecord] = None,
+    ) -> T:
+        hedging.sent_tokens += tokens
+        primary = asyncio.ensure_future(self._attempt(request, timeout, True, record))
+        tasks: Set[asyncio.Future] = {primary}
+        try:
+            delay = self.latencies.percentile(hedging.percentile)
+            if delay is not None and hedging.allows(tokens):
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and hedging.allows(tokens):
+                    # The duplicate counts against the rate limits but not the concurrency
+                    # limit, or it would queue behind the requests it is meant to overtake
+                    hedging.hedged_tokens += tokens
+                    await self._reserve(tokens)
+                    if primary.done():
+                        hedging.hedged_tokens -= tokens
+                    else:
+                        hedging.hedges += 1
+                        if record is not None:
+                            record.hedged = True
+                        tasks.add(
+                            asyncio.ensure_future(self._attempt(request, timeout, True, record))
+                        )
+
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.discard(task)
+                    # A failed attempt only counts once no other attempt is left
+                    if task.exception() is None or not tasks:
+                        if task is not primary and task.exception() is None:
+                            hedging.wins += 1
+                        return task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _reserve(self, tokens: int, check: Optional[Callable[[], None]] = None) -> None:
+        # Serialize reservations so waiting requests are served in arrival order
+        async with self._lock:
+            while True:
+                if check is not None:
+                    check()
+                delay = 0.0
+                if self._request_bucket:
+                    delay = max(delay, self._request_bucket.wait_time(1))
+                if self._token_bucket:
+                    delay = max(delay, self._token_bucket.wait_time(tokens))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+
+            if self._request_bucket:
+                self._request_bucket.consume(1)
+            if self._token_bucket:
+                self._token_bucket.consume(tokens)
+
+    def _is_retryable(self, e: Exception) -> bool:
+        if isinstance(e, asyncio.TimeoutError):
+            return True
+        status_code = getattr(e, "status_code", None)
+        if status_code is None:
+            # Connection errors and timeouts carry no status code
+            return type(e).__name__ in {"APIConnectionError", "APITimeoutError"}
+        return status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        retry_after = self._retry_after(e)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after) + random.uniform(0, self.base_delay)
+        # Full jitter: uniform over [0, base * 2^attempt]
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _retry_after(self, e: Exception) -> Optional[float]:
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,267 @@
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values: Sequence[float], p: float) -> Optional[float]:
+    """Nearest-rank `p` (0-100) percentile of `values`, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered)) - 1
+    return ordered[min(len(ordered) - 1, max(0, rank))]
+
+
+class RequestRecord:
+    def __init__(self, kind: str, filename: Optional[str] = None, chunk: Optional[int] = None):
+        """Timings and usage of one model request, including its retries. `kind` is
+        "chunk", "packed" or "reduce". Durations are in seconds; `ttft` is only known for
+        streamed requests. The scheduler fills in the timings, the caller the usage."""
+        self.kind = kind
+        self.filename = filename
+        self.chunk = chunk
+        self.timestamp = time.time()
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None  # start of the latest attempt
+        self.completed: Optional[float] = None
+        self.queue_wait = 0.0  # waiting for a concurrency slot
+        self.rate_wait = 0.0  # waiting for the RPM/TPM budget
+        self.backoff = 0.0  # sleeping between retries
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None  # of the attempt that succeeded
+        self.retries = 0
+        self.timeouts = 0  # attempts abandoned after the request timeout
+        self.hedged = False
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.price = 0.0
+        self.abandoned_price = 0.0  # of attempts cancelled in flight, e.g. hedge losers
+        self.error: Optional[str] = None
+
+    def start_attempt(self) -> None:
+        self.started = time.monotonic()
+        self.ttft = None
+
+    def first_token(self) -> None:
+        if self.ttft is None and self.started is not None:
+            self.ttft = time.monotonic() - self.started
+
+    def succeed(self, usage: tuple, price: float) -> None:
+        """Record the (prompt, completion, cached) token usage and price of the response."""
+        self.completed = time.monotonic()
+        self.prompt_tokens, self.completion_tokens, self.cached_tokens = usage
+        self.price = price
+
+    def fail(self, e: Exception) -> None:
+        self.completed = time.monotonic()
+        self.error = type(e).__name__
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "timestamp": self.timestamp,
+            "kind": self.kind,
+            "filename": self.filename,
+            "chunk": self.chunk,
+            "queue_wait": _round(self.queue_wait),
+            "rate_wait": _round(self.rate_wait),
+            "backoff": _round(self.backoff),
+            "ttft": _round(self.ttft),
+            "latency": _round(self.latency),
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedged": self.hedged,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "completion_tokens": self.completion_tokens,
+            "price": round(self.price, 8),
+            "abandoned_price": round(self.abandoned_price, 8),
+            "error": self.error,
+        }
+
+
+class Telemetry:
+    def __init__(self, model: str):
+        """Collects a `RequestRecord` per request of a run and summarizes them, so a slow
+        run can be put down to queueing for concurrency slots, rate limits or the model
+        itself."""
+        self.model = model
+        self.records: List[RequestRecord] = []
+
+    def record(
+        self, kind: str, filename: Optional[str] = None, chunk: Optional[int] = None
+    ) -> RequestRecord:
+        """Start the record of a request about to be submitted to the scheduler."""
+        record = RequestRecord(kind, filename, chunk)
+        self.records.append(record)
+        return record
+
+    def stats(self) -> Dict[str, Any]:
+        """Totals of the run, with p50/p95/p99 of each timing over successful requests.
+        Throughput is measured over the wall time from the first request submitted to
+        the last one completed. The price includes attempts cancelled in flight, which are
+        billed without a response; `hedge_price` is their share on hedged requests."""
+        done = [r for r in self.records if r.completed is not None]
+        ok = [r for r in done if r.error is None]
+        seconds = 0.0
+        if done:
+            seconds = max(r.completed for r in done) - min(r.submitted for r in done)
+        completion_tokens = sum(r.completion_tokens for r in ok)
+        total_tokens = completion_tokens + sum(r.prompt_tokens for r in ok)
+
+        def percentiles(values: List[float]) -> Dict[int, Optional[float]]:
+            return {p: percentile(values, p) for p in PERCENTILES}
+
+        return {
+            "requests": len(done),
+            "failed": len(done) - len(ok),
+            "retries": sum(r.retries for r in done),
+            "timeouts": sum(r.timeouts for r in done),
+            "hedged": sum(r.hedged for r in done),
+            "prompt_tokens": sum(r.prompt_tokens for r in ok),
+            "cached_tokens": sum(r.cached_tokens for r in ok),
+            "completion_tokens": completion_tokens,
+            "price": sum(r.price for r in ok) + sum(r.abandoned_price for r in done),
+            "abandoned_price": sum(r.abandoned_price for r in done),
+            "hedge_price": sum(r.abandoned_price for r in done if r.hedged),
+            "seconds": seconds,
+            "tokens_per_second": total_tokens / seconds if seconds else 0.0,
+            "output_tokens_per_second": completion_tokens / seconds if seconds else 0.0,
+            "latency": percentiles([r.latency for r in ok if r.latency is not None]),
+            "ttft": percentiles([r.ttft for r in ok if r.ttft is not None]),
+            "queue_wait": percentiles([r.queue_wait for r in ok]),
+            "rate_wait": percentiles([r.rate_wait for r in ok]),
+            # Where the time of all requests went, summed
+            "time": {
+                "queue_wait": sum(r.queue_wait for r in done),
+                "rate_wait": sum(r.rate_wait for r in done),
+                "backoff": sum(r.backoff for r in done),
+                "latency": sum(r.latency or 0.0 for r in done),
+            },
+        }
+
+    def to_jsonl(self) -> str:
+        lines = [
+            json.dumps({"model": self.model, **r.to_dict()}, ensure_ascii=False)
+            for r in self.records
+            if r.completed is not None
+        ]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_prometheus(self) -> str:
+        """The run in the Prometheus text exposition format. Every metric describes the
+        last run, so totals are gauges rather than counters."""
+        stats = self.stats()
+        done = [r for r in self.records if r.completed is not None]
+        ok = [r for r in done if r.error is None]
+        label = f'model="{_escape(self.model)}"'
+        lines: List[str] = []
+        declared = set()
+
+        def gauge(name: str, help: str, value: float, labels: str = "") -> None:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{{{label}{labels}}} {_number(value)}")
+
+        def summary(name: str, help: str, values: List[float]) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} summary")
+            for p in PERCENTILES:
+                value = percentile(values, p)
+                quantile = f'{label},quantile="{p / 100}"'
+                lines.append(f"{name}{{{quantile}}} {_number(value)}")
+            lines.append(f"{name}_sum{{{label}}} {_number(sum(values))}")
+            lines.append(f"{name}_count{{{label}}} {len(values)}")
+
+        for kind in sorted({r.kind for r in done}):
+            failed = sum(1 for r in done if r.kind == kind and r.error is not None)
+            total = sum(1 for r in done if r.kind == kind)
+            for status, count in (("ok", total - failed), ("error", failed)):
+                gauge(
+                    "sumgpt_run_requests",
+                    "Requests of the last run.",
+                    count,
+                    f',kind="{kind}",status="{status}"',
+                )
+        gauge("sumgpt_run_retries", "Retried attempts of the last run.", stats["retries"])
+        gauge("sumgpt_run_timeouts", "Attempts of the last run that timed out.", stats["timeouts"])
+        gauge("sumgpt_run_hedged_requests", "Requests raced against a duplicate.", stats["hedged"])
+        for kind in ("prompt", "cached", "completion"):
+            gauge(
+                "sumgpt_run_tokens",
+                "Tokens of the last run by type.",
+                stats[f"{kind}_tokens"],
+                f',type="{kind}"',
+            )
+        gauge("sumgpt_run_cost_dollars", "Price of the last run in USD.", stats["price"])
+        gauge(
+            "sumgpt_run_abandoned_cost_dollars",
+            "Price of requests cancelled in flight, e.g. timeouts and hedge losers.",
+            stats["abandoned_price"],
+        )
+        gauge(
+            "sumgpt_run_hedge_cost_dollars",
+            "Price of hedged attempts that lost their race.",
+            stats["hedge_price"],
+        )
+        gauge("sumgpt_run_duration_seconds", "Wall time of the last run.", stats["seconds"])
+        gauge(
+            "sumgpt_run_output_tokens_per_second",
+            "Completion tokens per second of wall time.",
+            stats["output_tokens_per_second"],
+        )
+        summary(
+            "sumgpt_request_latency_seconds",
+            "Time from sending a request to its complete response.",
+            [r.latency for r in ok if r.latency is not None],
+        )
+        summary(
+            "sumgpt_request_ttft_seconds",
+            "Time from sending a streamed request to its first token.",
+            [r.ttft for r in ok if r.ttft is not None],
+        )
+        summary(
+            "sumgpt_request_queue_wait_seconds",
+            "Time a request waited for a concurrency slot.",
+            [r.queue_wait for r in ok],
+        )
+        summary(
+            "sumgpt_request_rate_wait_seconds",
+            "Time a request waited for the rate limit budget.",
+            [r.rate_wait for r in ok],
+        )
+        gauge("sumgpt_run_timestamp_seconds", "Unix time the metrics were written.", time.time())
+        return "\n".join(lines) + "\n"
+
+    def write(self, jsonl_path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        """Write the records as JSONL and/or the metrics in the Prometheus text format.
+        The metrics file is replaced atomically, so a textfile collector never reads it
+        half written."""
+        if jsonl_path:
+            with open(jsonl_path, "w", encoding="utf-8") as f:
+                f.write(self.to_jsonl())
+        if prometheus_path:
+            temp_path = f"{prometheus_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(temp_path, prometheus_path)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 4)
+
+
+def _number(value: Optional[float]) -> str:
+    if value is None:
+        return "NaN"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
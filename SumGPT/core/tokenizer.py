@@ -1,14 +1,57 @@
-from typing import List
+import os
+import re
+import threading
+from typing import Dict, List, Tuple
 
 import tiktoken
 
+DEFAULT_ENCODING = "o200k_base"  # for models tiktoken does not know, e.g. self-hosted ones
+PARALLEL_ENCODE_SECTION = 1 << 18  # characters per section when encoding large texts
+
+# In these encodings a newline followed by a non-space character always ends a pre-token,
+# so texts cut right after such a newline encode to the same tokens in parts.
+_SAFE_CUT = re.compile(r"\n(?=\S)")
+_SAFE_CUT_ENCODINGS = {"cl100k_base", "o200k_base"}
+
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Return the process-wide encoding for `model`, loading it on first use."""
+    encoding = _encodings.get(model)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(model)
+            if encoding is None:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    encoding = tiktoken.get_encoding(DEFAULT_ENCODING)
+                _encodings[model] = encoding
+    return encoding
+
 
 class Tokenizer:
     def __init__(self, model: str):
-        self.tokenizer = tiktoken.encoding_for_model(model)
+        self.tokenizer = get_encoding(model)
 
     def tokenize(self, text: str) -> List[int]:
-        return self.tokenizer.encode(text)
+        # Treat special-token text such as "<|endoftext|>" as plain text
+        if (
+            len(text) <= 2 * PARALLEL_ENCODE_SECTION
+            or self.tokenizer.name not in _SAFE_CUT_ENCODINGS
+        ):
+            return self.tokenizer.encode(text, disallowed_special=())
+
+        # Encode sections of large texts on tiktoken's thread pool, which releases the GIL
+        sections = _sections(text, PARALLEL_ENCODE_SECTION)
+        tokens: List[int] = []
+        for section in self.tokenizer.encode_batch(
+            sections, num_threads=os.cpu_count() or 1, disallowed_special=()
+        ):
+            tokens.extend(section)
+        return tokens
 
     def detokenize(self, tokens: List[int]) -> str:
         return self.tokenizer.decode(tokens)
@@ -18,3 +61,65 @@ class Tokenizer:
         for token in tokens:
             results.append(self.tokenizer.decode_single_token_bytes(token).decode("utf-8"))
         return results
+
+    def split_spans(
+        self, text: str, chunk_size: int, overlap: int = 0
+    ) -> Tuple[List[Tuple[int, int, int]], int]:
+        """Split text into (start, end, tokens) character spans of at most `chunk_size`
+        tokens, each starting `chunk_size - overlap` tokens after the previous one.
+
+        Text is tokenized once and boundaries are measured in its UTF-8 bytes, moved
+        forward to the next character start so no character is split in two."""
+        tokens = self.tokenize(text)
+        data = text.encode("utf-8")
+
+        def snap(pos: int) -> int:
+            while pos < len(data) and 0x80 <= data[pos] < 0xC0:  # UTF-8 continuation byte
+                pos += 1
+            return pos
+
+        step = max(1, chunk_size - overlap)
+        byte_spans: List[Tuple[int, int, int]] = []
+        start = 0
+        for i in range(0, len(tokens), step):
+            window = tokens[i : i + chunk_size]
+            end = start + len(self.tokenizer.decode_bytes(window))
+            if snap(end) > snap(start):
+                byte_spans.append((snap(start), snap(end), len(window)))
+            if i + chunk_size >= len(tokens):
+                break
+            if step == chunk_size:
+                start = end
+            else:
+                start += len(self.tokenizer.decode_bytes(tokens[i : i + step]))
+
+        if len(data) == len(text):  # ASCII: byte and character offsets are the same
+            return byte_spans, len(tokens)
+        offsets = _char_offsets(data, {pos for span in byte_spans for pos in span[:2]})
+        return [(offsets[a], offsets[b], count) for a, b, count in byte_spans], len(tokens)
+
+
+def _sections(text: str, size: int) -> List[str]:
+    """Cut `text` into sections of roughly `size` characters at safe pre-token boundaries."""
+    sections = []
+    start = 0
+    while len(text) - start > size:
+        match = _SAFE_CUT.search(text, start + size)
+        if match is None:
+            break
+        sections.append(text[start : match.end()])
+        start = match.end()
+    sections.append(text[start:])
+    return sections
+
+
+def _char_offsets(data: bytes, positions) -> Dict[int, int]:
+    """Map byte offsets at character starts of UTF-8 `data` to character offsets."""
+    offsets = {}
+    chars = 0
+    previous = 0
+    for pos in sorted(positions):
+        chars += len(data[previous:pos].decode("utf-8"))
+        offsets[pos] = chars
+        previous = pos
+    return offsets
@@ -1,14 +1,42 @@
+from typing import Optional
+
+
 class Chunk:
-    def __init__(self, id: int, content: str, tokens: int, input_id: int):
+    # Chunks are created by the thousand for large uploads; slots keep each one small
+    __slots__ = ("id", "tokens", "input_id", "filename", "_source", "_start", "_end")
+
+    def __init__(
+        self,
+        id: int,
+        content: str,
+        tokens: int,
+        input_id: int,
+        start: int = 0,
+        end: Optional[int] = None,
+    ):
+        """`content` may be the whole text of the file, shared by all of its chunks, with
+        this chunk spanning `content[start:end]`. The slice is only taken when read."""
         self.id = id
-        self.content = content
         self.tokens = tokens
         self.input_id = input_id
         self.filename = None
+        self._source = content
+        self._start = start
+        self._end = len(content) if end is None else end
+
+    @property
+    def content(self) -> str:
+        if self._start == 0 and self._end == len(self._source):
+            return self._source
+        return self._source[self._start : self._end]
 
     def __str__(self) -> str:
         return f"Chunk(content={self.content}, tokens={self.tokens}, input_id={self.input_id})"
 
+    def preview(self, length: int) -> str:
+        """Return at most the first `length` characters of the content."""
+        return self._source[self._start : min(self._end, self._start + length)]
+
     def set_filename_from_list(self, filenames: list[str]) -> str:
         self.filename = filenames[self.input_id]
         return self.filename
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class LLMModelPricing:
@@ -7,25 +7,107 @@ class LLMModelPricing:
         self.output = output
         self.cached = cached
 
+    def calc_price(
+        self,
+        input_tokens: int,
+        output_tokens: int,
+        cached_tokens: int = 0,
+        scale_factor: int = 1000000,
+    ) -> float:
+        if cached_tokens != 0 and self.cached is not None:
+            input_tokens -= cached_tokens
+            return (
+                input_tokens * self.input + output_tokens * self.output + cached_tokens * self.cached
+            ) / scale_factor
+
+        return (input_tokens * self.input + output_tokens * self.output) / scale_factor
+
+
+class LLMModelLimits:
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = rpm  # requests per minute
+        self.tpm = tpm  # tokens per minute
+
+
+class LLMBackend:
+    def __init__(
+        self,
+        name: str = "openai",
+        base_url: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+        max_connections: int = 100,
+    ):
+        self.name = name
+        self.base_url = base_url  # None = the OpenAI API
+        self.headers = headers if headers else {}
+        self.max_connections = max_connections  # connection pool size
+
+    @property
+    def key(self) -> tuple:
+        """Identifies the connection pool; backends that differ in any setting get their own."""
+        headers = tuple(sorted(self.headers.items()))
+        return (self.name, self.base_url, headers, self.max_connections)
+
+    @staticmethod
+    def construct_from_dict(data: dict) -> "LLMBackend":
+        return LLMBackend(
+            name=data.get("name", "openai"),
+            base_url=data.get("base_url"),
+            headers=data.get("headers"),
+            max_connections=data.get("max_connections", 100),
+        )
+
+    @staticmethod
+    def construct_registry(data: List[dict]) -> Dict[str, "LLMBackend"]:
+        """Backends of the `backends` section of models.json by name."""
+        backends = [LLMBackend.construct_from_dict(backend) for backend in data]
+        return {backend.name: backend for backend in backends}
+
 
 class LLMModel:
     def __init__(
-        self, name: str, context_window: int, max_output_tokens: int, pricing: LLMModelPricing
+        self,
+        name: str,
+        context_window: int,
+        max_output_tokens: int,
+        pricing: LLMModelPricing,
+        limits: Optional[LLMModelLimits] = None,
+        backend: Optional[LLMBackend] = None,
     ):
         self.name = name
         self.context_window = context_window
         self.max_output_tokens = max_output_tokens
         self.pricing = pricing
+        self.limits = limits if limits else LLMModelLimits()
+        self.backend = backend if backend else LLMBackend()
 
     @staticmethod
-    def construct_from_dict(data: dict) -> "LLMModel":
+    def construct_from_dict(
+        data: dict, backends: Optional[Dict[str, LLMBackend]] = None
+    ) -> "LLMModel":
+        """`backend` names one of `backends`, or is a backend dict of its own."""
         pricing = LLMModelPricing(data["pricing"]["input"], data["pricing"]["output"])
         if "cached" in data["pricing"]:
             pricing.cached = data["pricing"]["cached"]
 
+        limits = LLMModelLimits()
+        if "limits" in data:
+            limits.rpm = data["limits"].get("rpm")
+            limits.tpm = data["limits"].get("tpm")
+
+        backend = LLMBackend()
+        if isinstance(data.get("backend"), str):
+            if not backends or data["backend"] not in backends:
+                raise ValueError(f"Model {data['model']} uses unknown backend {data['backend']}")
+            backend = backends[data["backend"]]
+        elif "backend" in data:
+            backend = LLMBackend.construct_from_dict(data["backend"])
+
         return LLMModel(
             name=data["model"],
             context_window=data["context_window"],
             max_output_tokens=data["max_output_tokens"],
             pricing=pricing,
+            limits=limits,
+            backend=backend,
         )
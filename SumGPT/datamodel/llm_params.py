@@ -1,4 +1,4 @@
-from datamodel.llm_model import LLMModel, LLMModelPricing  # noqa: F401
+from datamodel.llm_model import LLMBackend, LLMModel, LLMModelPricing  # noqa: F401
 
 
 class LLMParams:
@@ -0,0 +1,46 @@
+class RunParams:
+    def __init__(
+        self,
+        max_concurrency=16,
+        stream=True,
+        use_cache=True,
+        summary_mode="chunks",
+        cross_file=False,
+        reduce_prompt="{text}",
+        recursive_prompt="",
+        resume=True,
+        max_price=0.0,
+        max_tokens=0,
+        prefix_cache=False,
+        shared_context="",
+        file_context_tokens=0,
+        background=False,
+        pack_tokens=0,
+        request_timeout=0.0,
+        hedge_percentile=0.0,
+        hedge_budget=0.1,
+        dedupe_threshold=0.0,
+        compress_ratio=1.0,
+        manifest_owner="",
+    ):
+        self.max_concurrency: int = max_concurrency
+        self.stream: bool = stream
+        self.use_cache: bool = use_cache
+        self.summary_mode: str = summary_mode  # "chunks" or "map-reduce"
+        self.cross_file: bool = cross_file
+        self.reduce_prompt: str = reduce_prompt  # last merge
+        self.recursive_prompt: str = recursive_prompt  # merges before it, "" = reduce_prompt
+        self.resume: bool = resume
+        self.max_price: float = max_price  # hard spend cap in USD, 0 = none
+        self.max_tokens: int = max_tokens  # hard token cap, 0 = none
+        self.prefix_cache: bool = prefix_cache  # warm the prompt cache before fanning out
+        self.shared_context: str = shared_context  # few-shot examples or background
+        self.file_context_tokens: int = file_context_tokens  # leading file tokens per request
+        self.background: bool = background  # run as a server-side job (web UI only)
+        self.pack_tokens: int = pack_tokens  # pack small files into shared requests, 0 = off
+        self.request_timeout: float = request_timeout  # seconds per attempt, 0 = none
+        self.hedge_percentile: float = hedge_percentile  # duplicate slower requests, 0 = off
+        self.hedge_budget: float = hedge_budget  # max extra cost of hedges, share of the run
+        self.dedupe_threshold: float = dedupe_threshold  # near-duplicate similarity, 0 = off
+        self.compress_ratio: float = compress_ratio  # share of chunk tokens kept, 1 = off
+        self.manifest_owner: str = manifest_owner  # whose document manifests to update
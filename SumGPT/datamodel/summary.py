@@ -0,0 +1,38 @@
+from typing import Optional
+
+from datamodel.chunk import Chunk
+
+
+class Summary:
+    def __init__(
+        self,
+        chunk: Chunk,
+        content: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_tokens: int = 0,
+        price: float = 0,
+    ):
+        self.chunk = chunk
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.price = price
+        self.from_cache = False
+        self.resumed = False  # completed by an earlier attempt of the same run
+        self.saved_price = 0.0  # price of the original request, if reused or resumed
+        self.duplicate_of: Optional[Chunk] = None  # chunk whose summary this one reuses
+        self.error: Optional[str] = None
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> dict:
+        return {
+            "filename": self.chunk.filename,
+            "content": self.content,
+            "tokens": self.tokens,
+            "price": self.price,
+        }
@@ -16,10 +16,11 @@ def init():
 def main():
     manifest = io.read_json_file("SumGPT/manifest.json")
     models = io.read_json_file("SumGPT/models.json")
+    prompts = io.read_json_file("SumGPT/prompt.json")
 
     pg = Page()
     pg.draw_header(manifest["version"])
-    pg.draw_sidebar(manifest, models)
+    pg.draw_sidebar(manifest, models, prompts)
     pg.draw_body()
 
 
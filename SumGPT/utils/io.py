@@ -1,5 +1,4 @@
 import json
-from io import StringIO
 
 
 def read_json_file(file):
@@ -12,6 +11,11 @@ def write_json_file(file, data: dict):
         json.dump(data, f, indent=4)
 
 
-def read_to_string(file):
-    stringio = StringIO(file.getvalue().decode("utf-8"))
-    return stringio.read()
+def read_text_file(file):
+    with open(file, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def write_text_file(file, data: str):
+    with open(file, "w", encoding="utf-8") as f:
+        f.write(data)
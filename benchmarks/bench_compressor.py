@@ -0,0 +1,61 @@
+"""Throughput of the local extractive compressor on multi-MB inputs.
+
+    python benchmarks/bench_compressor.py --size-mb 8 --ratio 0.6
+
+Compression runs before any request is sent, so it must stay far faster than the model
+can consume its output. Reports MB/s, chunks/s and the share of tokens kept.
+"""
+
+import argparse
+import time
+from typing import Any, Dict, List
+
+from corpus import make_text
+from harness import print_results, result  # puts SumGPT on the import path
+
+from core.chunker import Chunker
+from core.compressor import Compressor
+from datamodel.chunk import Chunk
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=8.0)
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--ratio", type=float, default=0.6)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    text = make_text(int(args.size_mb * 1e6))
+    megabytes = len(text.encode("utf-8")) / 1e6
+    spans, total_tokens = Chunker(args.model, args.chunk_size, "paragraph").split(text)
+    chunks = [Chunk(i, text, tokens, 0, start, end) for i, (start, end, tokens) in enumerate(spans)]
+
+    compressor = Compressor(args.model, args.ratio)
+    start = time.perf_counter()
+    compressed = compressor.compress(chunks)
+    seconds = time.perf_counter() - start
+
+    kept_tokens = sum(chunk.tokens for chunk in compressed)
+    return [
+        result(
+            "compressor",
+            f"{args.size_mb:g}MB ratio {args.ratio:g}",
+            seconds,
+            megabytes=round(megabytes, 2),
+            chunks=len(chunks),
+            mb_per_second=round(megabytes / seconds, 2),
+            chunks_per_second=round(len(chunks) / seconds, 1),
+            tokens_before=total_tokens,
+            tokens_after=kept_tokens,
+            kept=round(kept_tokens / total_tokens, 3),
+        )
+    ]
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    print_results(run(args), args.json)
@@ -0,0 +1,61 @@
+"""Cost of `Crypto` key derivation, encryption and decryption.
+
+    python benchmarks/bench_crypto.py
+
+The config cookie is encrypted on every run and decrypted on every page load. Each
+`Crypto` and each decryption derives a key with scrypt, which dominates at config size;
+the large payload shows the cost of AES-GCM itself.
+"""
+
+import argparse
+import json
+from typing import Any, Dict, List
+
+from corpus import make_text
+from harness import measure, print_results, result  # puts SumGPT on the import path
+
+from core.crypto import Crypto
+
+PASSWORD = "benchmark-password"
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--large-mb", type=float, default=1.0, help="size of the large payload")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    config = json.dumps(
+        {"model": "gpt-4o-mini", "chunk_size": 2048, "role": make_text(2000), "stream": True}
+    )
+    payloads = (("config", config), (f"{args.large_mb:g}MB", make_text(int(args.large_mb * 1e6))))
+
+    crypto = Crypto(PASSWORD)
+    results = [result("crypto", "derive key", measure(lambda: Crypto(PASSWORD), args.repeat))]
+    for name, data in payloads:
+        encrypted = crypto.encrypt_b64(data)
+        assert crypto.decrypt_b64(encrypted) == data
+        size = len(data.encode("utf-8"))
+        for case, fn in (
+            ("encrypt", lambda: crypto.encrypt_b64(data)),
+            ("decrypt", lambda: crypto.decrypt_b64(encrypted)),
+        ):
+            seconds = measure(fn, args.repeat)
+            results.append(
+                result(
+                    "crypto",
+                    f"{case} {name}",
+                    seconds,
+                    bytes=size,
+                    mb_per_second=round(size / 1e6 / seconds, 2),
+                )
+            )
+    return results
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    print_results(run(args), args.json)
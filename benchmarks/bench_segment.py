@@ -0,0 +1,71 @@
+"""Chunking speed of every chunk mode, on one large text and on a corpus of files.
+
+    python benchmarks/bench_segment.py --size-mb 4 --files 200
+
+Measures `segment_text`, and `segment_files`, which chunks many files on a thread pool;
+`BodyHandler.segment_files` only adds Streamlit's cache around them.
+"""
+
+import argparse
+from typing import Any, Dict, List
+
+from corpus import make_corpus, make_text
+from harness import measure, print_results, result  # puts SumGPT on the import path
+
+from core.chunker import Chunker
+from core.pipeline import segment_files, segment_text
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4.0, help="size of the single text")
+    parser.add_argument("--files", type=int, default=200, help="files in the corpus")
+    parser.add_argument("--file-kb", type=float, default=20.0, help="average file size")
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--modes", default=",".join(Chunker.MODES))
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    text = make_text(int(args.size_mb * 1e6))
+    megabytes = len(text.encode("utf-8")) / 1e6
+    texts = make_corpus(args.files, int(args.file_kb * 1000))
+    corpus_megabytes = sum(len(t.encode("utf-8")) for t in texts) / 1e6
+
+    results = []
+    for mode in args.modes.split(","):
+        chunks, _ = segment_text(text, args.chunk_size, args.model, 0, mode)
+        seconds = measure(
+            lambda: segment_text(text, args.chunk_size, args.model, 0, mode), args.repeat
+        )
+        results.append(
+            result(
+                "segment_text",
+                f"{mode} {args.size_mb:g}MB",
+                seconds,
+                chunks=len(chunks),
+                mb_per_second=round(megabytes / seconds, 2),
+            )
+        )
+
+        seconds = measure(
+            lambda: segment_files(texts, args.chunk_size, args.model, mode), args.repeat
+        )
+        results.append(
+            result(
+                "segment_files",
+                f"{mode} {args.files} files",
+                seconds,
+                files_per_second=round(args.files / seconds, 1),
+                mb_per_second=round(corpus_megabytes / seconds, 2),
+            )
+        )
+    return results
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    print_results(run(args), args.json)
@@ -0,0 +1,124 @@
+"""End-to-end throughput of the generation path against the mock server.
+
+    python benchmarks/bench_throughput.py --concurrency 1,4,16,64 --latency 0.5 --rate-429 0.02
+
+Runs `Pipeline.summarize` over synthetic chunks at each concurrency level, through the
+real OpenAI client, connection pool, scheduler and budget, against a local
+`MockServer`. The server runs in this process unless `--server` points to one started
+separately, which keeps it from competing with the client for the GIL. The model's rate
+limits are lifted so only concurrency, the server's latency and its 429s shape the
+result. Reports requests/s, output tokens/s and the latency percentiles recorded by the
+run's telemetry.
+"""
+
+import argparse
+import os
+import time
+from typing import Any, Dict, List
+
+from corpus import make_corpus
+from harness import print_results, result  # puts SumGPT on the import path
+from mock_server import MockServer
+
+import utils.io as io
+from core.llm import run_pooled
+from core.pipeline import DEFAULT_ROLE, Pipeline, segment_text, sort_chunks
+from datamodel.llm_model import LLMBackend, LLMModel, LLMModelLimits
+from datamodel.llm_params import LLMParams
+from datamodel.run_params import RunParams
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_PATH = os.path.join(BASE_DIR, "..", "SumGPT", "models.json")
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma-separated levels")
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--latency", type=float, default=0.2, help="median server seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-normal latency shape")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share refused with 429")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--stream", action="store_true", help="stream every response")
+    parser.add_argument(
+        "--server", help="base URL of a mock server started separately (latency options unused)"
+    )
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def make_chunks(args: argparse.Namespace) -> list:
+    """At least `args.chunks` chunks of about `args.chunk_size` tokens, one per file."""
+    chunks = []
+    texts = make_corpus(args.chunks, args.chunk_size * 4, spread=0.2)
+    for input_id, text in enumerate(texts):
+        file_chunks, _ = segment_text(text, args.chunk_size, args.model, input_id)
+        for chunk in file_chunks:
+            chunk.filename = f"doc{input_id:04d}.txt"
+        chunks.extend(file_chunks)
+    return sort_chunks(chunks)[: args.chunks]
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    models_data = io.read_json_file(MODELS_PATH)
+    model_data = next(m for m in models_data["models"] if m["model"] == args.model)
+    backends = LLMBackend.construct_registry(models_data["backends"])
+    chunks = make_chunks(args)
+
+    results = []
+    for concurrency in (int(level) for level in args.concurrency.split(",")):
+        server = None
+        if not args.server:
+            server = MockServer(
+                args.latency, args.sigma, args.rate_429, completion_tokens=args.completion_tokens
+            ).start()
+        try:
+            model = LLMModel.construct_from_dict(model_data, backends)
+            model.limits = LLMModelLimits()
+            model.backend.base_url = args.server or server.url
+            llm_params = LLMParams(model, args.completion_tokens, 0.7)
+            run_params = RunParams(
+                max_concurrency=concurrency, stream=args.stream, use_cache=False, resume=False
+            )
+            pipeline = Pipeline("mock-key", llm_params, run_params, DEFAULT_ROLE)
+            on_partial = (lambda index, text: None) if args.stream else None
+
+            start = time.perf_counter()
+            summaries = run_pooled(pipeline.summarize(chunks, on_partial=on_partial))
+            seconds = time.perf_counter() - start
+        finally:
+            if server is not None:
+                server.stop()
+
+        stats = pipeline.telemetry.stats()
+        failed = sum(1 for summary in summaries if summary.error)
+        results.append(
+            result(
+                "throughput",
+                f"concurrency {concurrency}" + (" stream" if args.stream else ""),
+                seconds,
+                requests=len(chunks),
+                failed=failed,
+                throttled=server.throttled if server else None,
+                retries=stats["retries"],
+                requests_per_second=round(len(chunks) / seconds, 2),
+                output_tokens_per_second=round(stats["completion_tokens"] / seconds, 1),
+                latency_p50=_round(stats["latency"][50]),
+                latency_p95=_round(stats["latency"][95]),
+                latency_p99=_round(stats["latency"][99]),
+                ttft_p50=_round(stats["ttft"][50]),
+                queue_wait_p50=_round(stats["queue_wait"][50]),
+            )
+        )
+    return results
+
+
+def _round(value):
+    return None if value is None else round(value, 4)
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    print_results(run(args), args.json)
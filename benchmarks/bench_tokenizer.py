@@ -0,0 +1,62 @@
+"""Speed of `Tokenizer` on ASCII and multilingual text.
+
+    python benchmarks/bench_tokenizer.py --size-mb 4
+
+Covers tokenizing (serial below the parallel threshold, on tiktoken's thread pool above
+it), splitting into token-bounded spans and decoding. Multilingual text exercises the
+byte-to-character offset mapping of `split_spans`.
+"""
+
+import argparse
+from typing import Any, Dict, List
+
+from corpus import make_text
+from harness import measure, print_results, result  # puts SumGPT on the import path
+
+from core.tokenizer import PARALLEL_ENCODE_SECTION, Tokenizer
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    return parser
+
+
+def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    tokenizer = Tokenizer(args.model)
+    small_size = PARALLEL_ENCODE_SECTION  # below the threshold, always encoded serially
+    results = []
+    for name, multilingual in (("ascii", 0.0), ("multilingual", 0.2)):
+        text = make_text(int(args.size_mb * 1e6), multilingual=multilingual)
+        small = make_text(small_size, multilingual=multilingual)
+        megabytes = len(text.encode("utf-8")) / 1e6
+        small_megabytes = len(small.encode("utf-8")) / 1e6
+        tokens = tokenizer.tokenize(text)
+        cases = (
+            ("tokenize", lambda: tokenizer.tokenize(text), megabytes),
+            ("tokenize small", lambda: tokenizer.tokenize(small), small_megabytes),
+            ("split_spans", lambda: tokenizer.split_spans(text, args.chunk_size), megabytes),
+            ("detokenize", lambda: tokenizer.detokenize(tokens), megabytes),
+        )
+        for case, fn, size in cases:
+            seconds = measure(fn, args.repeat)
+            results.append(
+                result(
+                    "tokenizer",
+                    f"{case} {name}",
+                    seconds,
+                    megabytes=round(size, 2),
+                    mb_per_second=round(size / seconds, 2),
+                    tokens_per_second=round(len(tokens) * size / megabytes / seconds),
+                )
+            )
+    return results
+
+
+if __name__ == "__main__":
+    args = parser().parse_args()
+    print_results(run(args), args.json)
@@ -0,0 +1,85 @@
+"""Synthetic corpora for the benchmarks.
+
+    python benchmarks/corpus.py out/ --files 50 --size-kb 40
+
+Text is generated from a seed, so every run of a benchmark sees the same input. Writes
+the files of a corpus to a directory, e.g. to run the command line tool against it.
+"""
+
+import argparse
+import os
+import random
+from typing import List
+
+WORDS = (
+    "policy staff access review record customer revenue growth quarter product risk plan "
+    "budget team report contract supplier audit control incident security data system"
+).split()
+# Words outside ASCII, so token and character offsets differ
+MULTILINGUAL_WORDS = "données über ciudad 数据 系统 報告 исследование δεδομένα".split()
+FOOTER = "This document is confidential and intended only for internal use.\n"
+
+
+def make_text(size: int, seed: int = 0, multilingual: float = 0.0) -> str:
+    """About `size` characters of prose paragraphs mixed with tables of numbers and
+    repeated boilerplate. `multilingual` is the share of non-ASCII words in the prose."""
+    rng = random.Random(seed)
+
+    def word() -> str:
+        if multilingual and rng.random() < multilingual:
+            return rng.choice(MULTILINGUAL_WORDS)
+        return rng.choice(WORDS)
+
+    parts = []
+    length = 0
+    while length < size:
+        kind = rng.random()
+        if kind < 0.1:
+            rows = (" | ".join(f"{rng.uniform(0, 1000):.2f}" for _ in range(5)) for _ in range(8))
+            part = "\n".join(rows) + "\n\n"
+        elif kind < 0.2:
+            part = FOOTER
+        else:
+            sentences = (
+                " ".join(word() for _ in range(rng.randint(6, 30))).capitalize() + "."
+                for _ in range(rng.randint(2, 8))
+            )
+            part = " ".join(sentences) + "\n\n"
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def make_corpus(
+    files: int, size: int, seed: int = 0, spread: float = 0.5, multilingual: float = 0.0
+) -> List[str]:
+    """`files` texts of `size` characters on average, each up to `spread` (a share of
+    `size`) longer or shorter, so a corpus mixes small and large files."""
+    rng = random.Random(seed)
+    texts = []
+    for index in range(files):
+        length = max(1, int(size * (1 + rng.uniform(-spread, spread))))
+        texts.append(make_text(length, seed * 100003 + index, multilingual))
+    return texts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--size-kb", type=float, default=40.0, help="average file size")
+    parser.add_argument("--multilingual", type=float, default=0.0, help="non-ASCII word share")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    texts = make_corpus(args.files, int(args.size_kb * 1000), args.seed, 0.5, args.multilingual)
+    for index, text in enumerate(texts):
+        path = os.path.join(args.directory, f"doc{index:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(f"Wrote {len(texts)} files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Shared helpers of the benchmark scripts: import path, timing and result output."""
+
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "SumGPT"))
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5, warmup: int = 1) -> float:
+    """Fastest of `repeat` calls of `fn` in seconds, after `warmup` untimed calls. Other
+    load on the machine only ever adds time, so the minimum is the most stable figure."""
+    for _ in range(warmup):
+        fn()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def result(benchmark: str, case: str, seconds: float, **metrics: Any) -> Dict[str, Any]:
+    """One measurement. `benchmark` and `case` identify it across runs, `seconds` is the
+    time compared against a baseline; lower is better."""
+    return {"benchmark": benchmark, "case": case, "seconds": round(seconds, 6), **metrics}
+
+
+def print_results(results: List[Dict[str, Any]], as_json: bool) -> None:
+    """Print one JSON object per line, or an aligned table for people."""
+    if as_json:
+        for item in results:
+            print(json.dumps(item, ensure_ascii=False))
+        return
+    for item in results:
+        metrics = ", ".join(
+            f"{key}={value}" for key, value in item.items() if key not in ("benchmark", "case")
+        )
+        print(f"{item['benchmark']:>12} {item['case']:<28} {metrics}")
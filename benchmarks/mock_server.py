@@ -0,0 +1,387 @@
+"""A local OpenAI-compatible chat completions and Batch API server for load tests.
+
+    python benchmarks/mock_server.py --port 8000 --latency 0.8 --sigma 0.5 --rate-429 0.05
+    python -m SumGPT docs/ --base-url http://127.0.0.1:8000/v1 --api-key mock [--batch]
+
+Answers POST /v1/chat/completions, streamed or not, after a log-normal latency with
+median `latency` seconds. A share `rate_429` of requests is refused with 429 and a
+Retry-After header. Usage reports about one prompt token per 4 characters and
+`completion_tokens` output tokens, capped by the request's max_tokens.
+
+For the Batch API it stores uploaded files (POST /v1/files) and runs batches
+(POST /v1/batches) in place. A batch reports "in_progress" to its first `batch_polls`
+polls (GET /v1/batches/{id}), then "completed" with its output file, whose lines are in
+reverse order of the requests, and an error file for the requests whose custom_id is in
+`batch_failures` (GET /v1/files/{id}/content). Batch answers quote the start of the
+user message, so results can be checked against the requests they belong to.
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+
+CHARS_PER_TOKEN = 4  # prompt tokens are estimated from the message length
+BATCH_QUOTE_CHARS = 60  # characters of the user message quoted in batch answers
+
+
+class MockServer:
+    def __init__(
+        self,
+        latency: float = 0.5,
+        sigma: float = 0.0,
+        rate_429: float = 0.0,
+        retry_after: float = 0.1,
+        completion_tokens: int = 200,
+        stream_parts: int = 20,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        batch_polls: int = 1,
+        batch_failures: Iterable[str] = (),
+    ):
+        """Serve on `host`:`port` (0 = any free port) from a background thread once
+        started. `sigma` is the shape of the log-normal latency (0 = constant). Streamed
+        answers arrive in `stream_parts` evenly spaced parts. Batch requests whose
+        custom_id is in `batch_failures` fail with a server error."""
+        self.latency = latency
+        self.sigma = sigma
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.completion_tokens = completion_tokens
+        self.stream_parts = stream_parts
+        self.requests = 0
+        self.throttled = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self.batch_polls = batch_polls
+        self.batch_failures = set(batch_failures)
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, dict] = {}
+
+        server = self
+
+        class Handler(_Handler):
+            mock = server
+
+        self.httpd = _Server((host, port), Handler)
+
+    @property
+    def url(self) -> str:
+        """Base URL to give an OpenAI client."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _draw(self) -> tuple:
+        """Return (throttled, latency) of the next request."""
+        with self._lock:
+            self.requests += 1
+            if self._rng.random() < self.rate_429:
+                self.throttled += 1
+                return True, 0.0
+            return False, self.latency * math.exp(self.sigma * self._rng.gauss(0, 1))
+
+    def usage(self, messages: List[dict], max_tokens: Optional[int]) -> dict:
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+        prompt_tokens = max(1, prompt_chars // CHARS_PER_TOKEN)
+        completion_tokens = min(self.completion_tokens, max_tokens or self.completion_tokens)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def add_file(self, data: bytes) -> str:
+        with self._lock:
+            file_id = f"file-mock-{next(self._ids)}"
+            self.files[file_id] = data
+        return file_id
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str) -> dict:
+        """Run every request of the input file and store the output and error files."""
+        outputs, errors = [], []
+        lines = [line for line in self.files[input_file_id].decode("utf-8").splitlines() if line]
+        for number, line in enumerate(lines):
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            request_id = f"req-mock-{number}"
+            if custom_id in self.batch_failures:
+                # Failed lines carry a status code and no body
+                response = {"status_code": 500, "request_id": request_id, "body": None}
+                errors.append({"id": request_id, "custom_id": custom_id, "response": response})
+                continue
+            body = request["body"]
+            user = next(m["content"] for m in body["messages"] if m["role"] == "user")
+            content = f"summary of: {user[:BATCH_QUOTE_CHARS]}"
+            message = {"role": "assistant", "content": content}
+            completion = {
+                "id": f"chatcmpl-mock-{next(self._ids)}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "mock"),
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": self.usage(body["messages"], body.get("max_tokens")),
+            }
+            response = {"status_code": 200, "request_id": request_id, "body": completion}
+            outputs.append({"id": request_id, "custom_id": custom_id, "response": response})
+
+        def jsonl(items: List[dict]) -> Optional[str]:
+            if not items:
+                return None
+            return self.add_file("".join(json.dumps(i) + "\n" for i in items).encode("utf-8"))
+
+        batch = {
+            "id": f"batch-mock-{next(self._ids)}",
+            "object": "batch",
+            "endpoint": endpoint,
+            "input_file_id": input_file_id,
+            "completion_window": completion_window,
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+            "_polls": 0,
+            # The order of output lines is not that of the requests
+            "_output": jsonl(outputs[::-1]),
+            "_errors": jsonl(errors),
+            "_counts": {"total": len(lines), "completed": len(outputs), "failed": len(errors)},
+        }
+        with self._lock:
+            self.batches[batch["id"]] = batch
+        return self._public(batch)
+
+    def retrieve_batch(self, batch_id: str) -> Optional[dict]:
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            batch["_polls"] += 1
+            if batch["_polls"] > self.batch_polls:
+                batch["status"] = "completed"
+                batch["output_file_id"] = batch["_output"]
+                batch["error_file_id"] = batch["_errors"]
+                batch["request_counts"] = batch["_counts"]
+            return self._public(batch)
+
+    def _public(self, batch: dict) -> dict:
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 refuses bursts of connections
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive like the real API
+    # Headers and body are separate writes; with Nagle's algorithm the body would wait
+    # for the client's delayed ACK and add ~40 ms to every response
+    disable_nagle_algorithm = True
+    mock: MockServer
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        path = self.path.rstrip("/")
+        parts = path.split("/")
+        if "/batches/" in path:
+            batch = self.mock.retrieve_batch(parts[-1])
+            if batch is not None:
+                self._send_json(200, batch)
+                return
+        elif path.endswith("/content") and parts[-2] in self.mock.files:
+            self._send_bytes(200, self.mock.files[parts[-2]], "application/jsonl")
+            return
+        self._send_json(404, {"error": {"message": f"Not found: {self.path}"}})
+
+    def do_POST(self) -> None:
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.rstrip("/")
+        if path.endswith("/files"):
+            self._create_file(raw)
+        elif path.endswith("/batches"):
+            request = json.loads(raw)
+            batch = self.mock.create_batch(
+                request["input_file_id"], request["endpoint"], request["completion_window"]
+            )
+            self._send_json(200, batch)
+        elif path.endswith("/chat/completions"):
+            self._chat_completion(json.loads(raw or b"{}"))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _create_file(self, raw: bytes) -> None:
+        # A multipart/form-data upload with `file` and `purpose` fields
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("latin-1")
+        form = BytesParser(policy=HTTP).parsebytes(header + raw)
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in form.iter_parts()
+        }
+        data = fields["file"].get_payload(decode=True)
+        file_id = self.mock.add_file(data)
+        self._send_json(
+            200,
+            {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(data),
+                "created_at": int(time.time()),
+                "filename": fields["file"].get_filename() or "upload.jsonl",
+                "purpose": fields["purpose"].get_content().strip(),
+                "status": "processed",
+            },
+        )
+
+    def _chat_completion(self, body: dict) -> None:
+        throttled, latency = self.mock._draw()
+        if throttled:
+            error = {
+                "message": "Rate limit reached (mock)",
+                "type": "requests",
+                "code": "rate_limit_exceeded",
+            }
+            self._send_json(429, {"error": error}, {"retry-after": str(self.mock.retry_after)})
+            return
+
+        model = body.get("model", "mock")
+        limit = body.get("max_completion_tokens") or body.get("max_tokens")
+        usage = self.mock.usage(body.get("messages", []), limit)
+        words = ["summary"] * usage["completion_tokens"]
+        completion_id = f"chatcmpl-mock-{next(self.mock._ids)}"
+
+        if not body.get("stream"):
+            time.sleep(latency)
+            message = {"role": "assistant", "content": " ".join(words)}
+            choice = {"index": 0, "message": message, "finish_reason": "stop", "logprobs": None}
+            self._send_json(200, self._completion(completion_id, model, choice, usage))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        parts = max(1, min(self.mock.stream_parts, len(words)))
+        size = math.ceil(len(words) / parts) if words else 0
+        for part in range(parts):
+            time.sleep(latency / parts)
+            delta: Dict[str, Any] = {"content": " ".join(words[part * size : (part + 1) * size])}
+            if part == 0:
+                delta["role"] = "assistant"
+            if part:
+                delta["content"] = " " + delta["content"]
+            choice = {"index": 0, "delta": delta, "finish_reason": None, "logprobs": None}
+            self._send_event(self._completion(completion_id, model, choice, None, True))
+        choice = {"index": 0, "delta": {}, "finish_reason": "stop", "logprobs": None}
+        self._send_event(self._completion(completion_id, model, choice, None, True))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            final = self._completion(completion_id, model, None, usage, True)
+            self._send_event(final)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _completion(
+        self,
+        completion_id: str,
+        model: str,
+        choice: Optional[dict],
+        usage: Optional[dict],
+        chunk: bool = False,
+    ) -> dict:
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk" if chunk else "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [choice] if choice else [],
+            "usage": usage,
+        }
+
+    def _send_json(self, status: int, data: dict, headers: Optional[Dict[str, str]] = None):
+        self._send_bytes(status, json.dumps(data).encode("utf-8"), "application/json", headers)
+
+    def _send_bytes(
+        self,
+        status: int,
+        payload: bytes,
+        content_type: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_event(self, data: dict) -> None:
+        self._write_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def _write_chunk(self, data: bytes) -> None:
+        # HTTP/1.1 chunked transfer encoding; an empty chunk ends the response
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.5, help="median seconds")
+    parser.add_argument("--sigma", type=float, default=0.0, help="log-normal shape, 0 = fixed")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of requests refused")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="seconds")
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockServer(
+        args.latency,
+        args.sigma,
+        args.rate_429,
+        args.retry_after,
+        args.completion_tokens,
+        seed=args.seed,
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Serving on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"{server.requests} requests, {server.throttled} refused with 429")
+
+
+if __name__ == "__main__":
+    main()
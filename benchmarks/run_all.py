@@ -0,0 +1,114 @@
+"""Run every benchmark at a quick size and write the results as one JSON document.
+
+    python benchmarks/run_all.py -o baseline.json
+    python benchmarks/run_all.py -o after.json --baseline baseline.json --tolerance 0.2
+
+With `--baseline`, every result slower than its baseline by more than `tolerance` (a
+share) is listed and the exit code is 1, so a dependency upgrade that slows a hot path
+fails before it is merged. Results are matched by benchmark and case.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from importlib import metadata
+from typing import Any, Dict, List
+
+import harness  # noqa: F401  puts SumGPT on the import path
+
+# Module and the arguments of its quick run
+BENCHMARKS = {
+    "bench_segment": ["--size-mb", "1", "--files", "50"],
+    "bench_tokenizer": ["--size-mb", "1"],
+    "bench_crypto": [],
+    "bench_compressor": ["--size-mb", "1"],
+    "bench_throughput": ["--chunks", "100", "--concurrency", "1,8,32"],
+}
+MIN_DIFFERENCE = 0.001  # seconds; smaller slowdowns are timer noise, not regressions
+PACKAGES = ("tiktoken", "cryptography", "numpy", "openai", "langchain-openai", "httpx")
+
+
+def environment() -> Dict[str, Any]:
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.time(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": versions,
+    }
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float
+) -> List[str]:
+    """Describe every result more than `tolerance` and `MIN_DIFFERENCE` slower than its
+    baseline."""
+    previous = {(item["benchmark"], item["case"]): item["seconds"] for item in baseline}
+    regressions = []
+    for item in results:
+        before = previous.get((item["benchmark"], item["case"]))
+        after = item["seconds"]
+        if before and after > before * (1 + tolerance) and after - before > MIN_DIFFERENCE:
+            regressions.append(
+                f"{item['benchmark']} {item['case']}: {before * 1000:.3f} ms -> "
+                f"{after * 1000:.3f} ms ({after / before - 1:+.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="results file (default: stdout)")
+    parser.add_argument("--only", help="comma-separated benchmark modules to run")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown share")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    results: List[Dict[str, Any]] = []
+    for name in names:
+        module = importlib.import_module(name)
+        print(f"Running {name}...", file=sys.stderr)
+        results.extend(module.run(module.parser().parse_args(BENCHMARKS[name])))
+
+    document = json.dumps({**environment(), "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(document + "\n")
+    else:
+        print(document)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for regression in regressions:
+            print(f"Slower: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+        print(f"No result over {args.tolerance:.0%} slower than the baseline.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Batch mode against the mock server's Files and Batches endpoints.
+
+    python -m unittest discover tests
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "SumGPT"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import utils.io as io  # noqa: E402
+from core.batch import BATCH_DISCOUNT, BatchJob  # noqa: E402
+from core.pipeline import Pipeline  # noqa: E402
+from datamodel.chunk import Chunk  # noqa: E402
+from datamodel.llm_model import LLMBackend, LLMModel  # noqa: E402
+from datamodel.llm_params import LLMParams  # noqa: E402
+from datamodel.run_params import RunParams  # noqa: E402
+from mock_server import BATCH_QUOTE_CHARS, MockServer  # noqa: E402
+
+MODELS_PATH = os.path.join(ROOT, "SumGPT", "models.json")
+
+
+def make_chunks():
+    """Chunks of three files, not in (input_id, id) order, each with distinct text."""
+    chunks = []
+    for input_id, chunk_count in ((2, 3), (0, 4), (1, 1)):
+        for id in reversed(range(chunk_count)):
+            content = f"File {input_id} chunk {id}. " + "Some text to summarize. " * 5
+            chunk = Chunk(id, content, 40, input_id)
+            chunk.filename = f"file{input_id}.txt"
+            chunks.append(chunk)
+    return chunks
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        # Request files are written under the working directory
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        models_data = io.read_json_file(MODELS_PATH)
+        model_data = next(m for m in models_data["models"] if m["model"] == "gpt-4o-mini")
+        backends = LLMBackend.construct_registry(models_data["backends"])
+        self.llm_params = LLMParams(LLMModel.construct_from_dict(model_data, backends), 256, 0.7)
+        self.run_params = RunParams(use_cache=False, resume=False)
+        self.chunks = make_chunks()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def summarize(self, server, batch_id=None):
+        job = BatchJob("mock-key", self.llm_params, server.url, poll_interval=0.01)
+        pipeline = Pipeline("mock-key", self.llm_params, self.run_params, "Summarize.")
+        return asyncio.run(pipeline.summarize_batch(self.chunks, job, batch_id))
+
+    def assert_summary_of(self, summary, chunk):
+        self.assertIs(summary.chunk, chunk)
+        self.assertIsNone(summary.error)
+        self.assertEqual(summary.content, f"summary of: {chunk.content[:BATCH_QUOTE_CHARS]}")
+        self.assertGreater(summary.prompt_tokens, 0)
+        self.assertGreater(summary.completion_tokens, 0)
+
+    def test_results_follow_chunk_order(self):
+        # The server writes output lines in reverse order; results must still map back
+        # to the chunk each custom_id came from
+        with MockServer(batch_polls=2) as server:
+            summaries = self.summarize(server)
+            self.assertEqual(len(server.batches), 1)
+        self.assertEqual(len(summaries), len(self.chunks))
+        for summary, chunk in zip(summaries, self.chunks):
+            self.assert_summary_of(summary, chunk)
+
+    def test_price_is_discounted(self):
+        with MockServer() as server:
+            summary = self.summarize(server)[0]
+        full_price = self.llm_params.model.pricing.calc_price(
+            summary.prompt_tokens, summary.completion_tokens
+        )
+        self.assertAlmostEqual(summary.price, round(full_price * BATCH_DISCOUNT, 6))
+
+    def test_failed_requests(self):
+        failed = self.chunks[1]
+        with MockServer(batch_failures=[BatchJob.custom_id(failed)]) as server:
+            summaries = self.summarize(server)
+        for summary, chunk in zip(summaries, self.chunks):
+            if chunk is failed:
+                self.assertIs(summary.chunk, chunk)
+                self.assertIn("500", summary.error)
+            else:
+                self.assert_summary_of(summary, chunk)
+
+    def test_resume_from_batch_id(self):
+        with MockServer() as server:
+            job = BatchJob("mock-key", self.llm_params, server.url, poll_interval=0.01)
+            systems = ["Summarize."] * len(self.chunks)
+            batch_id = asyncio.run(job.submit(self.chunks, systems))
+            summaries = self.summarize(server, batch_id)
+            self.assertEqual(len(server.batches), 1)  # nothing was submitted again
+        for summary, chunk in zip(summaries, self.chunks):
+            self.assert_summary_of(summary, chunk)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+"""Token counts of the structural chunking modes.
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "SumGPT"))
+
+from core.chunker import Chunker  # noqa: E402
+from core.pipeline import segment_text  # noqa: E402
+from core.tokenizer import Tokenizer  # noqa: E402
+
+MODEL = "gpt-4o-mini"
+PARAGRAPH = (
+    "The quick brown fox jumps over the lazy dog. It was not amused!  Why? "
+    'Because "dogs" sleep (mostly).\nA line without a full stop\n- a list item\n\n'
+    "  An indented paragraph. Numbers like 3.14 and abbreviations, e.g. etc.\n\n\n"
+)
+TEXT = (
+    "# Title\n\n"
+    + PARAGRAPH * 20
+    + "## Part two\n"
+    + PARAGRAPH * 20
+    + "中文句子。第二句！第三句？」结束。\n下一行。 空格后。"
+)
+
+
+class ChunkerTest(unittest.TestCase):
+    def test_chunk_tokens_add_up_to_the_text(self):
+        # Counting each piece on its own must not split the tokens at its edges, e.g. the
+        # space that the tokenizer joins to the word after it
+        total = len(Tokenizer(MODEL).tokenize(TEXT))
+        for mode in Chunker.MODES:
+            with self.subTest(mode=mode):
+                chunks, total_tokens = segment_text(TEXT, 100, MODEL, 0, mode)
+                self.assertEqual(sum(chunk.tokens for chunk in chunks), total)
+                self.assertEqual(total_tokens, total)
+                self.assertEqual("".join(chunk.content for chunk in chunks), TEXT)
+                self.assertLessEqual(max(chunk.tokens for chunk in chunks), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()